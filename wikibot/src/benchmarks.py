@@ -0,0 +1,94 @@
+import random
+import string
+import time
+import typing
+import ngram
+import scraper
+import text_gen
+import tokenizer
+import utils
+
+def timed(function: typing.Callable, *, repeat: int = 5) -> float:
+    """
+        Times a function
+
+        :param function: The function to time, called without arguments
+        :param repeat: Number of times to call the function
+        :returns: The fastest time taken by a call, in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_text_similarity(lengths: tuple[int, ...] = (20, 100, 1000), *, bound: int = 5, seed: int = 0) -> None:
+    """
+        Benchmarks scraper.text_similarity on long titles, both unbounded and with the bound columbia_encyclopedia uses
+
+        :param lengths: The title lengths to benchmark
+        :param bound: The bound to benchmark with
+        :param seed: The seed for the random titles
+    """
+    rng = random.Random(seed)
+    for length in lengths:
+        a = ''.join(rng.choices(string.ascii_lowercase + ' ', k=length))
+        similar = a[:length // 2] + 'x' + a[length // 2 + 1:]  # One substitution away
+        different = ''.join(rng.choices(string.ascii_lowercase + ' ', k=length))
+
+        for name, b in (('similar', similar), ('different', different)):
+            unbounded = timed(lambda: scraper.text_similarity(a, b))
+            bounded = timed(lambda: scraper.text_similarity(a, b, bound=bound))
+            print(f"text_similarity {length:>5} chars, {name:<9}: {unbounded * 1000:9.3f}ms unbounded, {bounded * 1000:9.3f}ms with bound={bound}")
+
+def bench_text_generation(words: int = 100_000, vocabulary: int = 2_000, *, draws: int = 100_000, seed: int = 0) -> None:
+    """
+        Benchmarks drawing words with TextGenerator, walking the chain and starting over whenever it runs into a dead end
+
+        :param words: Length of the random text the trigrams are built from
+        :param vocabulary: Number of distinct words in the text
+        :param draws: Number of words to draw
+        :param seed: The seed for the random text and the generator
+    """
+    rng = random.Random(seed)
+    text = [f"w{rng.randrange(vocabulary)}" for _ in range(words)]
+    trigrams = ngram.Trigrams(text)
+    build = timed(lambda: text_gen.TextGenerator.from_trigrams(trigrams, seed=seed), repeat=1)
+    speaker = text_gen.TextGenerator.from_trigrams(trigrams, seed=seed)
+
+    def walk() -> None:
+        prev2, prev = text[0], text[1]
+        for _ in range(draws):
+            curr, status = speaker.speak_from_word(prev2, prev)
+            prev2, prev = (text[0], text[1]) if status else (prev, curr)
+
+    elapsed = timed(walk, repeat=3)
+    print(f"TextGenerator {len(trigrams)} trigrams: {build * 1000:.1f}ms to build, {draws / elapsed:,.0f} words/s")
+
+def bench_tokenizer(size: int = 1_000_000, *, seed: int = 0) -> None:
+    """
+        Benchmarks tokenizer.tokenize_sentences against the Tokenizer chain it replaces, on scraped-looking text
+
+        :param size: Roughly how many characters of text to tokenize
+        :param seed: The seed for the random text
+    """
+    rng = random.Random(seed)
+    words = ['the', 'The', 'city', 'river', 'was', 'founded', 'in', '1850', "it's", "they're", "can't", "I'm", 'north-east', ',', '(see', 'below)', '[1]']
+    sentences: list[str] = []
+    length = 0
+    while length < size:
+        sentence = ' '.join(rng.choices(words, k=rng.randrange(5, 25))) + '.'
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    text = ' '.join(sentences)
+    megabytes = len(text.encode()) / 1e6
+
+    chain = timed(lambda: tokenizer.Tokenizer(text.split('.')).remove_brackets().break_contractions_on(utils.TokenizeType.WORD_SENT), repeat=3)
+    fused = timed(lambda: tokenizer.tokenize_sentences(text), repeat=3)
+    print(f"Tokenizer chain: {megabytes / chain:8.2f}MB/s, tokenize_sentences: {megabytes / fused:8.2f}MB/s")
+
+if __name__ == '__main__':
+    bench_text_similarity()
+    bench_text_generation()
+    bench_tokenizer()
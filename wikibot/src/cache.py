@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import zlib
+import json
+import time
+import os
+import utils
+
+scraper_env = utils.PROJECT.SCRAPER
+
+CACHE_FILE = scraper_env['CACHE_FILE']
+CACHE_TTL = scraper_env['CACHE_TTL']
+CACHE_MAX_BYTES = scraper_env['CACHE_MAX_BYTES']
+
+def normalize(query: str) -> str:
+    """ Lowercases the query and collapses its whitespace, so "Ice  Cream" and "ice cream" share a cache entry """
+    return ' '.join(query.lower().split())
+
+class ScrapeCache:
+    def __init__(self, path: str = CACHE_FILE, *, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        """
+            An on-disk (SQLite) cache of scraped results, keyed by site and normalized query.
+            Entries expire after `ttl` seconds, and the least recently used entries are evicted once the cache grows past `max_bytes`.
+
+            :param path: The SQLite file to store the cache in (defaults to CACHE_FILE from config.toml)
+            :param ttl: Number of seconds an entry stays fresh
+            :param max_bytes: Maximum total size of the (compressed) cached results
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._lock = threading.Lock()  # The ScrapeSites are fetched from several threads
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                site TEXT NOT NULL,
+                query TEXT NOT NULL,
+                lim INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (site, query, lim)
+            )
+        ''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)')
+        self._connection.commit()
+
+    def get(self, site: str, query: str, limit: int) -> list[str] | None:
+        """
+            Looks up cached results
+
+            :param site: The host url of the site
+            :param query: The query that was searched for
+            :param limit: The number of pages that were searched
+            :returns: The cached results, None if there are none (or they expired)
+        """
+        key = (site, normalize(query), limit)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, created FROM pages WHERE site = ? AND query = ? AND lim = ?', key
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:  # Expired
+                    self._connection.execute('DELETE FROM pages WHERE site = ? AND query = ? AND lim = ?', key)
+                    self._connection.commit()
+                self.misses += 1
+                return None
+
+            self._connection.execute('UPDATE pages SET accessed = ? WHERE site = ? AND query = ? AND lim = ?', (now, *key))
+            self._connection.commit()
+            self.hits += 1
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, site: str, query: str, limit: int, results: list[str]) -> None:
+        """
+            Caches results, evicting the least recently used entries if the cache grows too large
+
+            :param site: The host url of the site
+            :param query: The query that was searched for
+            :param limit: The number of pages that were searched
+            :param results: The scraped results
+        """
+        body = zlib.compress(json.dumps(results).encode())
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (site, normalize(query), limit, body, len(body), now, now)
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        # Expired entries go first, then the least recently used ones until we fit in max_bytes
+        self._connection.execute('DELETE FROM pages WHERE created < ?', (time.time() - self.ttl,))
+
+        total = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for rowid, size in self._connection.execute('SELECT rowid, size FROM pages ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self._connection.executemany('DELETE FROM pages WHERE rowid = ?', evicted)
+
+    def clear(self) -> None:
+        """ Removes every entry and resets the counters """
+        with self._lock:
+            self._connection.execute('DELETE FROM pages')
+            self._connection.commit()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"ScrapeCache({self.path}, {len(self)} entries, {self.hits} hits, {self.misses} misses)"
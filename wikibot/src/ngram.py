@@ -1,32 +1,127 @@
+import typing
+import numpy as np
 import utils
 
+ID_BITS = 21  # Bits per word ID in a packed trigram key, so a model holds up to 2 ** 21 distinct words
+ID_MASK = (1 << ID_BITS) - 1
+BUFFER_SIZE = 1 << 16  # Words buffered by add_words before they're packed into keys
+
 class Trigrams:
-    def __init__(self, words: list[utils.Word]) -> None:
-        self.words = words
-        self.grams: dict[str, dict[str, dict[str, float]]] = {}
-        self.make_trigrams()
+    def __init__(self, words: typing.Iterable[utils.Word] = ()) -> None:
+        """
+            Trigram counts over a stream of words.
+            Words are interned to integer IDs, and every trigram is packed into one integer key: (prev2 << 42) | (prev << 21) | curr.
+            Counts live in two flat arrays sorted by key, so all the trigrams of a (prev2, prev) context are one contiguous range.
+            Probabilities are never stored (a TextGenerator works from the counts), so add_words never has to renormalize anything.
+
+            :param words: The words to count trigrams over (more can be streamed in with add_words)
+        """
+        self.ids: dict[str, int] = {}
+        self.vocabulary: list[str] = []
+
+        self.keys = np.empty(0, dtype=np.int64)  # Sorted, unique
+        self.counts = np.empty(0, dtype=np.int64)
+        self._pending: list[np.ndarray] = []  # Keys added since the arrays were last merged
+        self._buffer: list[int] = []  # IDs of words not packed into keys yet, starting with the last two that were, so the stream carries on
+        self._grams: dict[str, dict[str, dict[str, float]]] = None
+        self.first: str = None  # The first word added, capitalized
+
+        self.add_words(words)
+
+    @classmethod
+    def from_counts(cls, vocabulary: list[str], keys: np.ndarray, counts: np.ndarray, first: str = None) -> 'Trigrams':
+        """
+            Makes trigrams out of counts that were already worked out, eg. ones loaded from a TrigramStore
+
+            :param vocabulary: The words, indexed by ID
+            :param keys: The packed trigram keys, sorted and unique
+            :param counts: The count of each key
+            :param first: The first word
+            :returns: The trigrams
+        """
+        trigrams = cls()
+        trigrams.vocabulary = list(vocabulary)
+        trigrams.ids = {word: word_id for word_id, word in enumerate(trigrams.vocabulary)}
+        trigrams.keys = np.asarray(keys, dtype=np.int64)
+        trigrams.counts = np.asarray(counts, dtype=np.int64)
+        trigrams.first = first
+        return trigrams
+
+    def intern(self, word: str) -> int:
+        """ Returns the ID of a word, giving it one if it's new """
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.vocabulary)
+            if word_id > ID_MASK:
+                raise OverflowError(f"Trigrams can't hold more than {ID_MASK + 1} distinct words")
+            self.vocabulary.append(word)
+        return word_id
+
+    def add_words(self, words: typing.Iterable[str]) -> None:
+        """
+            Counts the trigrams of more words, continuing on from the words added before.
+            Words are buffered and packed into keys BUFFER_SIZE at a time, so adding one short sentence at a time is cheap.
 
-        self.first: str = words[0].capitalize()
+            :param words: The words to add
+        """
+        start = len(self._buffer)
+        self._buffer.extend(self.intern(word) for word in words)
+        if len(self._buffer) == start:
+            return
+
+        if self.first is None:
+            self.first = self.vocabulary[self._buffer[0]].capitalize()
+        self._grams = None
+        if len(self._buffer) >= BUFFER_SIZE:
+            self._pack()
+
+    def _pack(self) -> None:
+        # Packs the buffered words into keys, keeping the last two to carry on from
+        if len(self._buffer) >= 3:
+            ids = np.array(self._buffer, dtype=np.int64)
+            self._pending.append((ids[:-2] << (2 * ID_BITS)) | (ids[1:-1] << ID_BITS) | ids[2:])
+            self._buffer = self._buffer[-2:]
 
     def make_trigrams(self) -> None:
-        """ Populates the grams dictionary with trigrams """
-        for prev2, prev, curr in zip(self.words[:-2], self.words[1:-1], self.words[2:]):
-            gram_prev2 = self.grams.get(prev2)
-            if gram_prev2 is None:
-                self.grams[prev2] = {}  # Create a dictionary if one does not exist already
-            
-            gram_prev = self.grams[prev2].get(prev)
-            if gram_prev is None:
-                self.grams[prev2][prev] = {}  # Create a dictionary if one does not exist already
-
-            gram_curr = self.grams[prev2][prev].get(curr)
-            if gram_curr is None:
-                self.grams[prev2][prev][curr] = 0  # Initialize the word with frequency = 0, as the frequency is instantly increased in the next line
-            
-            self.grams[prev2][prev][curr] += 1
-
-        for k, v in self.grams.items():
-            for k2, v2 in v.items():
-                v2_sum = sum(v2.values())
-                for k3, v3 in v2.items():
-                    self.grams[k][k2][k3] = v3/v2_sum  # Smooth the probabilities
+        """ Merges the trigrams added since the last merge into the sorted arrays """
+        self._pack()
+        if not self._pending:
+            return
+
+        keys = np.concatenate([self.keys] + self._pending)
+        counts = np.concatenate([self.counts] + [np.ones(len(pending), dtype=np.int64) for pending in self._pending])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(self.keys)).astype(np.int64)
+        self._pending = []
+
+    @property
+    def grams(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+            The probabilities as nested dicts of prev2 -> prev -> curr -> probability (built on first use after a change).
+            Only kept for compatibility: nothing here needs them, and text_gen.TextGenerator.from_trigrams reads the arrays directly
+        """
+        if self._grams is None:
+            self.make_trigrams()
+            grams: dict[str, dict[str, dict[str, float]]] = {}
+            starts = self.context_starts()
+            totals = np.add.reduceat(self.counts, starts).tolist() if len(starts) else []
+            bounds = starts.tolist() + [len(self.keys)]
+            keys = self.keys.tolist()
+            counts = self.counts.tolist()
+            for index, start in enumerate(bounds[:-1]):
+                key = keys[start]
+                following = grams.setdefault(self.vocabulary[key >> (2 * ID_BITS)], {}).setdefault(self.vocabulary[(key >> ID_BITS) & ID_MASK], {})
+                for position in range(start, bounds[index + 1]):
+                    following[self.vocabulary[keys[position] & ID_MASK]] = counts[position] / totals[index]  # Smooth the probabilities
+            self._grams = grams
+        return self._grams
+
+    def context_starts(self) -> np.ndarray:
+        """ Returns the positions in the sorted keys (and counts) where each (prev2, prev) context's range starts """
+        self.make_trigrams()
+        contexts = self.keys >> ID_BITS
+        return np.flatnonzero(np.concatenate(([True], contexts[1:] != contexts[:-1]))) if len(contexts) else np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        self.make_trigrams()
+        return len(self.keys)
@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import contextlib
+import threading
+import os
+import typing
+import ngram
+import tokenizer
+import text_gen
+import pos_tagger
+import utils
+import scraper
+import cache
+import query_analyzer
+import trigram_store
+import data
+
+SPEAKERS = 32  # Topics whose TextGenerators Pipeline.about keeps, most recently used first
+
+class Pipeline:
+    def __init__(self, analyzer: query_analyzer.RecurrentNeuralNetwork, tagger: pos_tagger.Tagger, fetcher: scraper.Scraper, store: trigram_store.TrigramStore = None) -> None:
+        """
+            Answers queries: tokenize -> tag -> find the focus -> scrape -> trigrams -> generate.
+            Nothing here writes to the model, the tagger or the scraper (and the store locks its own writes), so one Pipeline can serve many queries at once.
+
+            :param analyzer: A trained query analyzer
+            :param tagger: A loaded POS tagger
+            :param fetcher: The scraper to search with
+            :param store: Where to keep the trigrams of every focus, so a focus that comes up again isn't scraped again (defaults to scraping every time)
+        """
+        self.analyzer = analyzer
+        self.tagger = tagger
+        self.fetcher = fetcher
+        self.store = store
+
+        self._speakers: collections.OrderedDict[str, text_gen.TextGenerator] = collections.OrderedDict()  # Topic -> its TextGenerator, see about
+        self._speakers_lock = threading.Lock()
+        self._topic_locks: dict[str, tuple[threading.Lock, int]] = {}  # Topic -> its lock, and how many queries hold or wait on it
+        self._topic_locks_lock = threading.Lock()
+
+    def focus(self, query: str) -> str:
+        """
+            Finds what the query is asking about
+
+            :param query: The query
+            :returns: The focus of the query, or the whole query if the analyzer can't tell
+        """
+        if not query.strip():
+            return query
+
+        # Not Tokenizer.break_contractions: it raises a KeyError on negations it doesn't list (eg. "don't"), and its lists are shared by every thread
+        tokens = tokenizer.expand_contractions(tokenizer.WORD_PATTERN.findall(query))
+
+        tagged = utils.convert_tagged(self.tagger.tag(utils.make_words(tokens)))
+        pos_only = [word.pos.value for word in tagged]
+
+        pos_sent = utils.pad(pos_only, padding_character=-1, length=self.analyzer.input_size)[:self.analyzer.input_size]
+        prediction = int(self.analyzer.predict_batch([pos_sent])[0])  # predict_batch doesn't touch the analyzer's state
+        focus = query_analyzer.interpret_prediction(prediction, tagged)
+
+        if isinstance(focus, list):
+            return ' '.join(str(word) for word in focus) or query
+        if isinstance(focus, utils.WordShell):
+            return str(focus)
+        return query
+
+    @staticmethod
+    def count(results: typing.Iterable[str]) -> ngram.Trigrams:
+        """
+            Counts the trigrams of scraped results.
+            Results are tokenized and counted one sentence at a time as they come in, so `results` can be a stream such as Scraper.stream.
+            The tokenizer splits sentences on their full stops, so each one gets a '.' token back, and the trigrams know where sentences end.
+
+            :param results: The scraped results
+            :returns: The trigrams
+        """
+        trigrams = ngram.Trigrams()
+        for result in results:
+            for words in tokenizer.iter_sentences(result):
+                if words:
+                    words[0] = words[0].capitalize()
+                    if not text_gen.ends_sentence(words[-1]):
+                        words.append('.')
+                    trigrams.add_words(words)
+        return trigrams
+
+    @staticmethod
+    def speaker(trigrams: ngram.Trigrams) -> text_gen.TextGenerator | None:
+        """
+            Sets up a TextGenerator for trigrams
+
+            :param trigrams: The trigrams
+            :returns: The TextGenerator, None if there's nothing to generate from
+        """
+        if not trigrams:  # Fewer than 3 words
+            return None
+        return text_gen.TextGenerator.from_trigrams(trigrams)
+
+    @staticmethod
+    def generate(speaker: text_gen.TextGenerator) -> str:
+        """ Generates an answer, bounded by the budgets in config.toml so one query can't hold up the others """
+        return speaker.generate(prefer_terminal=True)
+
+    @contextlib.contextmanager
+    def _topic_lock(self, focus: str) -> typing.Generator[None, None, None]:
+        """ Holds a lock per topic, so concurrent queries about the same focus don't both scrape it and merge it into the store twice """
+        topic = cache.normalize(focus)
+        with self._topic_locks_lock:
+            lock, users = self._topic_locks.get(topic, (None, 0))
+            lock = lock or threading.Lock()
+            self._topic_locks[topic] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._topic_locks_lock:
+                lock, users = self._topic_locks[topic]
+                if users == 1:
+                    del self._topic_locks[topic]  # Nobody else wants it, so the dict doesn't grow with every topic ever asked about
+                else:
+                    self._topic_locks[topic] = (lock, users - 1)
+
+    def about(self, focus: str) -> str:
+        """
+            Answers about a focus, out of the store if it has come up before and out of freshly scraped results otherwise.
+            With a store, the TextGenerators of the last SPEAKERS topics are kept too, so a topic that comes up again skips setting one up (and its distances are only searched once).
+
+            :param focus: The focus of a query
+            :returns: The answer
+        """
+        topic = cache.normalize(focus)
+        with self._topic_lock(focus):
+            with self._speakers_lock:
+                speaker = self._speakers.get(topic)
+                if speaker is not None:
+                    self._speakers.move_to_end(topic, last=False)
+
+            if speaker is None:
+                trigrams = self.store.load(focus) if self.store is not None else None
+                if trigrams is None:
+                    trigrams = self.count(self.fetcher.stream(focus))
+                    if self.store is not None:
+                        self.store.merge(focus, trigrams)
+
+                speaker = self.speaker(trigrams)
+                if speaker is not None and self.store is not None:  # Without a store every query scrapes afresh, so there's nothing to reuse
+                    with self._speakers_lock:
+                        self._speakers[topic] = speaker
+                        self._speakers.move_to_end(topic, last=False)
+                        if len(self._speakers) > SPEAKERS:
+                            self._speakers.popitem()
+
+        return (self.generate(speaker) if speaker is not None else '') or f"I couldn't find anything about {focus}."
+
+    def answer(self, query: str) -> str:
+        """
+            Answers a query
+
+            :param query: The query
+            :returns: The answer
+        """
+        return self.about(self.focus(query))
+
+    async def answer_async(self, query: str) -> str:
+        """
+            Answers a query without blocking the event loop, so many queries can be answered at once
+
+            :param query: The query
+            :returns: The answer
+        """
+        focus = await asyncio.to_thread(self.focus, query)
+        return await asyncio.to_thread(self.about, focus)
+
+def load(*, workers: int = None) -> Pipeline:
+    """
+        Loads (or trains) the query analyzer and the POS tagger, and sets up the scraper and the trigram store
+
+        :param workers: Number of processes to train the query analyzer with, if it isn't cached (defaults to the number of CPUs)
+        :returns: The pipeline
+    """
+    analyzer = query_analyzer.RecurrentNeuralNetwork(10, 12, 1)
+    analyzer.train_or_load(data.DATA, data.DATA, min_time=0.75, workers=workers or os.cpu_count() or 1)
+
+    tagger = pos_tagger.Tagger()
+    fetcher = scraper.Scraper(cache=cache.ScrapeCache())
+    return Pipeline(analyzer, tagger, fetcher, trigram_store.TrigramStore())
@@ -5,6 +5,54 @@ import pickle
 import os
 import utils
 import string
+import numpy as np
+import hashlib
+import functools
+import json
+import sys
+import concurrent.futures
+import random
+import time
+
+# The feature templates of Tagger._get_features, in the order it adds them, with the number of values each one takes
+FEATURE_TEMPLATES: tuple[tuple[str, int], ...] = (
+    ('bias', 0),
+    ('i suffix', 1),
+    ('i pref1', 1),
+    ('i-1 tag', 1),
+    ('i-2 tag', 1),
+    ('i tag+i-2 tag', 2),
+    ('i word', 1),
+    ('i-1 tag+i word', 2),
+    ('i-1 word', 1),
+    ('i-1 suffix', 1),
+    ('i-2 word', 1),
+    ('i+1 word', 1),
+    ('i+1 suffix', 1),
+    ('i+2 word', 1),
+)
+
+def split_feature(feature: str) -> tuple[int, str | tuple[str, str]] | None:
+    """
+        Splits a feature string back into its template and values
+
+        :param feature: The feature string. Eg. "i-1 tag+i word NN dog"
+        :returns: The index of the template in FEATURE_TEMPLATES and the value key (a string, or a tuple for two-valued templates), None if it matches no template
+    """
+    for index, (name, arity) in enumerate(FEATURE_TEMPLATES):
+        if arity == 0:
+            if feature == name:
+                return index, ''
+        elif feature.startswith(name + ' '):
+            values = feature[len(name) + 1:]
+            return index, (values if arity == 1 else tuple(values.split(' ', 1)))
+    return None
+
+# Templates that only look at the words, so their features can be looked up for every token at once
+STATIC_TEMPLATES = tuple(i for i, (name, _) in enumerate(FEATURE_TEMPLATES) if 'tag' not in name)
+WEIGHT_SCALE = 1000  # Averaged weights are rounded to 3 decimals, so they're stored exactly as integer thousandths
+MAPPED_MAGIC = b'WBPOSMM1'
+MAPPED_ALIGNMENT = 64
 
 class Perceptron:
     def __init__(self):
@@ -42,6 +90,8 @@ class Perceptron:
         return None
 
     def average_weights(self):
+        if not self.i:
+            return None  # Never updated, so there's nothing to average (and every weight is still zero)
         for feat, weights in self.weights.items():
             new_feat_weights = {}
             for clas, weight in weights.items():
@@ -58,20 +108,244 @@ class Perceptron:
         self.weights = pickle.load(open(path))
 
 
+class ArrayPerceptron:
+    def __init__(self, weights: np.ndarray, classes: list[str]) -> None:
+        """
+            An array-backed perceptron: a feature -> row index (found by row(), which subclasses implement), and a dense (n_features + 1, n_classes) weight matrix.
+            The last row is all zeros, and stands in for features the model doesn't know.
+            Weights are integer thousandths, so sums are exact and ties break the same way as in Perceptron.
+
+            :param weights: The weight matrix
+            :param classes: The class of each column, sorted
+        """
+        self.weights = weights
+        self.classes = classes
+        self.missing = len(weights) - 1  # Row of zeros
+
+    def row(self, template: int, key: str | tuple[str, str]) -> int:
+        raise NotImplementedError
+
+    def best(self, scores: np.ndarray) -> str:
+        # Ties go to the greater label, like Perceptron.predict
+        return self.classes[len(scores) - 1 - int(np.argmax(scores[::-1]))]
+
+    def predict(self, features: dict[str, int]) -> str:
+        """ Same interface as Perceptron.predict """
+        rows = []
+        for feature, value in features.items():
+            split = split_feature(feature)
+            if split is not None and value:
+                rows.extend([self.row(*split)] * value)
+        return self.best(self.weights[rows].sum(axis=0))
+
+class CompactPerceptron(ArrayPerceptron):
+    def __init__(self, feature_ids: list[dict], weights: np.ndarray, classes: list[str]) -> None:
+        """
+            An ArrayPerceptron that finds rows through a dict per feature template
+
+            :param feature_ids: One dict per template in FEATURE_TEMPLATES, of value key -> row
+            :param weights: The weight matrix
+            :param classes: The class of each column, sorted
+        """
+        super().__init__(weights, classes)
+        self.feature_ids = feature_ids
+
+    @classmethod
+    def from_perceptron(cls, perceptron: Perceptron, classes: set[str]) -> 'CompactPerceptron':
+        """ Converts a dict-backed Perceptron """
+        class_list = sorted(classes)
+        class_index = {label: i for i, label in enumerate(class_list)}
+
+        feature_ids = [{} for _ in FEATURE_TEMPLATES]
+        rows: list[dict] = []
+        for feature, weights in perceptron.weights.items():
+            split = split_feature(feature)
+            if split is None or not weights:
+                continue
+            template, key = split
+            feature_ids[template][key] = len(rows)
+            rows.append(weights)
+
+        matrix = np.zeros((len(rows) + 1, len(class_list)), dtype=np.int32)
+        for row, weights in enumerate(rows):
+            for label, weight in weights.items():
+                if label in class_index:
+                    matrix[row, class_index[label]] = round(weight * WEIGHT_SCALE)
+        return cls(feature_ids, matrix, class_list)
+
+    def row(self, template: int, key: str | tuple[str, str]) -> int:
+        return self.feature_ids[template].get(key, self.missing)
+
+    def save(self, path: str, tagdict: dict[str, str]) -> None:
+        """
+            Saves the model (and the tag dictionary) to an .npz file
+
+            :param path: The file to save to
+            :param tagdict: The tag dictionary of the Tagger
+        """
+        arrays = {
+            'weights': self.weights,
+            'classes': np.array(self.classes),
+            'tagdict_words': np.array(list(tagdict.keys()), dtype=str),
+            'tagdict_tags': np.array(list(tagdict.values()), dtype=str),
+        }
+        for template, ids in enumerate(self.feature_ids):
+            keys = [' '.join(key) if isinstance(key, tuple) else key for key in ids.keys()]
+            arrays[f'keys_{template}'] = np.array(keys, dtype=str)
+            arrays[f'rows_{template}'] = np.fromiter(ids.values(), dtype=np.int64, count=len(ids))
+
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> tuple['CompactPerceptron', dict[str, str]]:
+        """
+            Loads a model saved by save()
+
+            :param path: The file to load from
+            :returns: The model, and the tag dictionary
+        """
+        with np.load(path) as saved:
+            feature_ids = []
+            for template, (_, arity) in enumerate(FEATURE_TEMPLATES):
+                keys = saved[f'keys_{template}'].tolist()
+                if arity == 2:
+                    keys = [tuple(key.split(' ', 1)) for key in keys]
+                feature_ids.append(dict(zip(keys, saved[f'rows_{template}'].tolist())))
+
+            tagdict = dict(zip(saved['tagdict_words'].tolist(), saved['tagdict_tags'].tolist()))
+            return cls(feature_ids, saved['weights'], saved['classes'].tolist()), tagdict
+
+def feature_hash(template: int, key: str | tuple[str, str]) -> int:
+    '''A stable (unlike hash()) non-zero 64-bit hash of a feature, for the MappedPerceptron hash table.'''
+    value = '\x1f'.join(key) if isinstance(key, tuple) else key
+    digest = hashlib.blake2b(f'{template}\x1f{value}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1  # 0 marks an empty slot
+
+class MappedPerceptron(ArrayPerceptron):
+    def __init__(self, path: str, *, cache_size: int = 65536) -> None:
+        """
+            An ArrayPerceptron read straight out of a memory-mapped file, so loading is near-instant and forked workers share one copy through the page cache.
+            Instead of dicts, features are found through an open addressing hash table (of feature_hash -> row) kept in flat arrays.
+            File layout: MAPPED_MAGIC, the length of a JSON header (uint64), the header, then the arrays it lists, each aligned to MAPPED_ALIGNMENT bytes.
+
+            :param path: The model file, written by MappedPerceptron.write
+            :param cache_size: Number of feature lookups to remember in this process
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(MAPPED_MAGIC)) != MAPPED_MAGIC:
+                raise ValueError(f"{path} is not a mapped POS model")
+            header = json.loads(f.read(int.from_bytes(f.read(8), 'little')))
+
+        arrays = {
+            # Plain ndarray views of the maps, numpy.memmap itself makes every operation slower
+            name: np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape)).view(np.ndarray)
+            for name, (offset, dtype, shape) in header['arrays'].items()
+        }
+        super().__init__(arrays['weights'], header['classes'])
+        self.tagdict: dict[str, str] = header['tagdict']
+
+        self.table_hashes = arrays['table_hashes']
+        self.table_rows = arrays['table_rows']
+        self.mask = len(self.table_hashes) - 1
+        self.row = functools.lru_cache(maxsize=cache_size)(self._row)
+
+    def _row(self, template: int, key: str | tuple[str, str]) -> int:
+        target = feature_hash(template, key)
+        slot = target & self.mask
+        while True:  # Linear probing
+            found = int(self.table_hashes[slot])
+            if found == target:
+                return int(self.table_rows[slot])
+            if found == 0:
+                return self.missing
+            slot = (slot + 1) & self.mask
+
+    @staticmethod
+    def write(path: str, model: CompactPerceptron, tagdict: dict[str, str]) -> None:
+        """
+            Writes a CompactPerceptron (and the tag dictionary) in the memory-mappable format
+
+            :param path: The file to write
+            :param model: The model to write
+            :param tagdict: The tag dictionary of the Tagger
+        """
+        features = [(template, key, row) for template, ids in enumerate(model.feature_ids) for key, row in ids.items()]
+        size = 1
+        while size < 2 * len(features):  # Keep the table at most half full, so probes stay short
+            size *= 2
+
+        table_hashes = np.zeros(size, dtype=np.uint64)
+        table_rows = np.zeros(size, dtype=np.int32)
+        for template, key, row in features:
+            target = feature_hash(template, key)
+            slot = target & (size - 1)
+            while table_hashes[slot]:
+                if int(table_hashes[slot]) == target:
+                    raise ValueError(f"Hash collision on feature {template} {key!r}")
+                slot = (slot + 1) & (size - 1)
+            table_hashes[slot] = target
+            table_rows[slot] = row
+
+        weights = np.ascontiguousarray(model.weights, dtype=np.int32)
+        arrays = {'weights': weights, 'table_hashes': table_hashes, 'table_rows': table_rows}
+
+        def align(offset: int) -> int:
+            return -(-offset // MAPPED_ALIGNMENT) * MAPPED_ALIGNMENT
+
+        # The offsets depend on the header's length, so grow the header until the offsets it holds fit after it
+        header_length = 0
+        while True:
+            offset = align(len(MAPPED_MAGIC) + 8 + header_length)
+            layout = {}
+            for name, array in arrays.items():
+                layout[name] = (offset, array.dtype.str, array.shape)
+                offset = align(offset + array.nbytes)
+            header = json.dumps({'classes': list(model.classes), 'tagdict': tagdict, 'arrays': layout}).encode()
+            if len(header) <= header_length:
+                break
+            header_length = len(header)
+        header = header.ljust(header_length)
+
+        with open(path, 'wb') as f:
+            f.write(MAPPED_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            for name, array in arrays.items():
+                f.write(b'\0' * (layout[name][0] - f.tell()))
+                f.write(array.tobytes())
+
+def convert(source: str, destination: str) -> None:
+    '''Converts a pickled (or compact .npz) POS model into the memory-mappable format.'''
+    tagger = Tagger(load=False)
+    if source.endswith('.npz'):
+        tagger.compact, tagger.tagdict = CompactPerceptron.load(source)
+    else:
+        tagger.load(source)
+    MappedPerceptron.write(destination, tagger.compact, tagger.tagdict)
+
 class Tagger:
     START = ['-START-', '-START2-']
     END = ['-END-', '-END2-']
     AP_MODEL_LOC = os.path.join(os.path.dirname(__file__), utils.PROJECT.POS_TAGGER['PERCEPTRON_PICKLE'])
+    COMPACT_MODEL_LOC = os.path.join(os.path.dirname(__file__), utils.PROJECT.POS_TAGGER['COMPACT_MODEL'])
+    MAPPED_MODEL_LOC = os.path.join(os.path.dirname(__file__), utils.PROJECT.POS_TAGGER['MAPPED_MODEL'])
 
     def __init__(self, load=True):
         self.model = Perceptron()
         self.tagdict = {}
         self.classes = set()
+
+        self.compact: ArrayPerceptron = None  # Built by compile(), for tag(fast=True)
+        self.mapped_loc: str = None  # Set by load_mapped, for tag_sents(processes=...)
+
         if load:
-            self.load(self.AP_MODEL_LOC)
+            self.load_mapped()
 
-    def tag(self, corpus):
-        '''Tags a string `corpus`.'''
+    def tag(self, corpus, *, fast=True):
+        '''Tags a string `corpus`. The fast path gives the same tags, except that it also checks the tag dictionary.'''
+        if fast:
+            return self._tag_fast([corpus])[0]
 
         prev, prev2 = self.START
         tokens = []
@@ -101,8 +375,121 @@ class Tagger:
             raise FileNotFoundError(msg)
         self.model.weights, self.tagdict, self.classes = w_td_c
         self.model.classes = self.classes
+        self.compile()
         return None
 
+    def load_compact(self, loc=COMPACT_MODEL_LOC, pickle_loc=AP_MODEL_LOC):
+        '''Loads the compact model, converting (and saving) it from the pickle the first time.'''
+        if os.path.exists(loc):
+            self.compact, self.tagdict = CompactPerceptron.load(loc)
+            self.classes = set(self.compact.classes)
+            self.model = self.compact  # Has the same predict(features), for tag(fast=False)
+            return None
+
+        self.load(pickle_loc)
+        self.compact.save(loc, self.tagdict)
+        return None
+
+    def load_mapped(self, loc=MAPPED_MODEL_LOC):
+        '''Memory-maps the model, converting (and saving) it from the compact model or the pickle the first time.'''
+        if not os.path.exists(loc):
+            self.load_compact()
+            MappedPerceptron.write(loc, self.compact, self.tagdict)
+
+        self.compact = MappedPerceptron(loc)
+        self.mapped_loc = loc
+        self.tagdict = self.compact.tagdict
+        self.classes = set(self.compact.classes)
+        self.model = self.compact  # Has the same predict(features), for tag(fast=False)
+        return None
+
+    def compile(self):
+        '''Converts the model's weights into a CompactPerceptron, so tagging never has to build feature strings.'''
+        self.compact = CompactPerceptron.from_perceptron(self.model, self.classes)
+        return None
+
+    def tag_sents(self, sentences, *, fast=True, processes=None, chunk_size=256):
+        '''
+            Tags a list of sentences (each a list of Words). Every sentence starts from the START context, unlike one flat tag() call.
+
+            :param sentences: The sentences to tag
+            :param fast: Whether to use the fast path (see tag)
+            :param processes: Number of worker processes to tag with (defaults to tagging in this process). Needs a model loaded with load_mapped, which the workers map too.
+            :param chunk_size: Number of sentences sent to a worker at a time
+            :returns: A list of (word, tag) lists, one per sentence
+        '''
+        if processes and processes > 1:
+            if self.mapped_loc is None:
+                raise ValueError("Tagging with processes needs a model loaded with load_mapped")
+
+            texts = [[word.word for word in sentence] for sentence in sentences]
+            chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_init_tag_worker, initargs=(self.mapped_loc,)) as pool:
+                tags = [tag for chunk in pool.map(_tag_chunk, chunks, [fast] * len(chunks)) for tag in chunk]
+            return [list(zip(sentence, sentence_tags)) for sentence, sentence_tags in zip(sentences, tags)]
+
+        if fast:
+            return self._tag_fast(sentences)
+        return [self.tag(sentence, fast=False) for sentence in sentences]
+
+    def _tag_fast(self, sentences, *, block_size=1024):
+        if self.compact is None:
+            self.compile()
+        model = self.compact
+        weights = model.weights
+        row = model.row
+        tagdict = self.tagdict
+
+        results = [[] for _ in sentences]
+        contexts = [self.START + [w.word.lower() for w in sentence] + self.END for sentence in sentences]
+        positions = [(s, i) for s, sentence in enumerate(sentences) for i in range(len(sentence))]
+        tag_scores = {}  # (prev, prev2) -> summed rows of the features that only look at earlier tags
+
+        prev, prev2 = self.START
+        for start in range(0, len(positions), block_size):
+            block = positions[start:start + block_size]
+
+            # Sum the rows of the features that don't depend on earlier tags for the whole block in one gather
+            static_rows = np.empty((len(block), len(STATIC_TEMPLATES)), dtype=np.int64)
+            for k, (s, i) in enumerate(block):
+                text = sentences[s][i].word
+                context = contexts[s]
+                j = i + len(self.START)
+                static_rows[k] = (
+                    row(0, ''),
+                    row(1, text[-3:]),
+                    row(2, text[:1]),
+                    row(6, context[j]),
+                    row(8, context[j-1]),
+                    row(9, context[j-1][-3:]),
+                    row(10, context[j-2]),
+                    row(11, context[j+1]),
+                    row(12, context[j+1][-3:]),
+                    row(13, context[j+2]),
+                )
+            static_scores = weights[static_rows].sum(axis=1)
+
+            for k, (s, i) in enumerate(block):
+                if i == 0:
+                    prev, prev2 = self.START  # New sentence
+                word = sentences[s][i]
+                text = word.word
+                if text in string.punctuation:
+                    results[s].append((word, "PUNC"))
+                    continue
+
+                tag = tagdict.get(text) or tagdict.get(text.lower())
+                if not tag:
+                    j = i + len(self.START)
+                    previous = tag_scores.get((prev, prev2))
+                    if previous is None:
+                        previous = tag_scores[prev, prev2] = weights[[row(3, prev), row(4, prev2), row(5, (prev, prev2))]].sum(axis=0)
+                    tag = model.best(static_scores[k] + previous + weights[row(7, (prev, contexts[s][j]))])
+                results[s].append((word, tag))
+                prev2 = prev
+                prev = tag
+        return results
+
     def _get_features(self, i, word, context, prev, prev2):
         def add(name, *args):
             features[' '.join((name,) + tuple(args))] += 1
@@ -126,6 +513,110 @@ class Tagger:
         add('i+2 word', context[i+2])
         return features
 
+    def train(self, sentences, *, epochs=5, held_out=0.1, seed=0, checkpoint=None, pickle_loc=None, compact_loc=None, mapped_loc=None):
+        '''
+            Trains a new model with the averaged perceptron, and saves it in the fast formats
+
+            :param sentences: A list of (words, tags) pairs, one per sentence
+            :param epochs: Number of passes over the training sentences (shuffled before every pass)
+            :param held_out: Fraction of the sentences kept aside to measure accuracy on
+            :param seed: The seed for the split and the shuffling. Every epoch's order only depends on the seed and the epoch, so a resumed run trains exactly like an uninterrupted one
+            :param checkpoint: A file to save the training state to after every epoch. If it already exists, training resumes from it.
+            :param pickle_loc: Where to save the model as a pickle (the original format)
+            :param compact_loc: Where to save the model as a compact .npz (see CompactPerceptron)
+            :param mapped_loc: Where to save the model as a memory-mappable file (see MappedPerceptron)
+            :returns: The accuracy on the held out sentences
+        '''
+        rng = random.Random(seed)
+        sentences = list(sentences)
+        rng.shuffle(sentences)
+        split = int(len(sentences) * held_out)
+        test, train = sentences[:split], sentences[split:]
+
+        self.model = Perceptron()
+        self.tagdict = {}
+        self.classes = set()
+        self.compact = None
+        self.mapped_loc = None
+        self._make_tagdict(train)
+        self.model.classes = self.classes
+
+        start_epoch = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, 'rb') as f:
+                state = pickle.load(f)
+            start_epoch = state['epoch']
+            self.model.weights, self.model._totals, self.model._tstamps, self.model.i = state['model']
+            print(f"Resuming from epoch {start_epoch}")
+
+        for epoch in range(start_epoch, epochs):
+            order = train[:]
+            random.Random(f'{seed}-{epoch}').shuffle(order)
+            correct = total = 0
+            started = time.perf_counter()
+            for words, tags in order:
+                prev, prev2 = self.START
+                context = self.START + [w.lower() for w in words] + self.END
+                for i, (word, truth) in enumerate(zip(words, tags)):
+                    if word in string.punctuation:
+                        continue  # Tagged PUNC without the model, see tag()
+
+                    guess = self.tagdict.get(word)
+                    if not guess:
+                        features = self._get_features(i, word, context, prev, prev2)
+                        guess = self.model.predict(features)
+                        self.model.update(truth, guess, features)
+                    prev2 = prev
+                    prev = guess
+                    correct += guess == truth
+                    total += 1
+
+            elapsed = time.perf_counter() - started
+            print(f"Epoch {epoch + 1}/{epochs}: {total / elapsed:.0f} tokens/s, training accuracy {utils.grade(100 * correct / max(total, 1))}")
+
+            if checkpoint:
+                with open(checkpoint, 'wb') as f:
+                    pickle.dump({
+                        'epoch': epoch + 1,
+                        'model': (self.model.weights, self.model._totals, self.model._tstamps, self.model.i)
+                    }, f)
+
+        self.model.average_weights()  # Catches up every weight's lazy total once, at the end
+        self.compile()
+
+        if pickle_loc:
+            with open(pickle_loc, 'wb') as f:
+                pickle.dump((self.model.weights, self.tagdict, self.classes), f)
+        if compact_loc:
+            self.compact.save(compact_loc, self.tagdict)
+        if mapped_loc:
+            MappedPerceptron.write(mapped_loc, self.compact, self.tagdict)
+
+        return self.evaluate(test)
+
+    def evaluate(self, sentences):
+        '''
+            Measures tagging accuracy and speed, with the fast path
+
+            :param sentences: A list of (words, tags) pairs, one per sentence
+            :returns: The fraction of (non-punctuation) words tagged correctly
+        '''
+        words = [[utils.Word(word, -1, -1) for word in sentence] for sentence, _ in sentences]
+        started = time.perf_counter()
+        tagged = self.tag_sents(words)
+        elapsed = time.perf_counter() - started
+
+        correct = total = 0
+        for (_, tags), sentence in zip(sentences, tagged):
+            for truth, (word, guess) in zip(tags, sentence):
+                if guess != "PUNC":
+                    correct += guess == truth
+                    total += 1
+
+        accuracy = correct / max(total, 1)
+        print(f"Tagged {sum(map(len, words)) / max(elapsed, 1e-9):.0f} tokens/s, held out accuracy {utils.grade(100 * accuracy)}")
+        return accuracy
+
     def _make_tagdict(self, sentences):
         counts = defaultdict(lambda: defaultdict(int))
         for words, tags in sentences:
@@ -141,3 +632,36 @@ class Tagger:
             # Only add quite unambiguous words
             if n >= freq_thresh and (float(mode) / n) >= ambiguity_thresh:
                 self.tagdict[word] = tag
+
+_worker_tagger: Tagger = None  # Set in each worker process by _init_tag_worker
+
+def _init_tag_worker(mapped_loc):
+    global _worker_tagger
+    _worker_tagger = Tagger(load=False)
+    _worker_tagger.load_mapped(mapped_loc)
+
+def _tag_chunk(texts, fast):
+    # Only the tags go back to the parent process, which still has the Words
+    sentences = [[utils.Word(text, -1, -1) for text in sentence] for sentence in texts]
+    return [[tag for _, tag in sentence] for sentence in _worker_tagger.tag_sents(sentences, fast=fast)]
+
+def read_tagged(path):
+    '''Reads a tagged corpus with one sentence per line, as space separated word/TAG pairs.'''
+    sentences = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            pairs = [token.rsplit('/', 1) for token in line.split() if '/' in token]
+            if pairs:
+                sentences.append(([word for word, _ in pairs], [tag for _, tag in pairs]))
+    return sentences
+
+if __name__ == '__main__':
+    # python pos_tagger.py convert trontagger-0.1.0.pickle trontagger-0.1.0.bin
+    # python pos_tagger.py train corpus.txt mytagger  (writes mytagger.pickle, mytagger.npz and mytagger.bin)
+    if sys.argv[1] == 'convert':
+        convert(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == 'train':
+        Tagger(load=False).train(
+            read_tagged(sys.argv[2]), checkpoint=f'{sys.argv[3]}.checkpoint',
+            pickle_loc=f'{sys.argv[3]}.pickle', compact_loc=f'{sys.argv[3]}.npz', mapped_loc=f'{sys.argv[3]}.bin'
+        )
@@ -4,6 +4,13 @@ import math
 import data
 import warnings
 import typing
+import hashlib
+import json
+import os
+import sys
+import time
+import multiprocessing
+import concurrent.futures
 
 warnings.filterwarnings("error")  # Treat warnings as errors
 
@@ -13,15 +20,33 @@ DAMPING = analyzer_env['DAMPING']
 ALPHA = analyzer_env['ALPHA']
 EPOCHS = analyzer_env['EPOCHS']
 TESTING_THRESHOLD = analyzer_env['TESTING_THRESHOLD']
+MODEL_CACHE = analyzer_env['MODEL_CACHE']
+EVAL_INTERVAL = analyzer_env['EVAL_INTERVAL']
+PATIENCE = analyzer_env['PATIENCE']
+DIVERGENCE = analyzer_env['DIVERGENCE']
 
 DATASET = list[tuple[list[int], int]]
 
+class TrainingStalled(Exception):
+    """ Raised by RecurrentNeuralNetwork.train_on when the loss plateaus or diverges """
+    ...
+
+class TrainingStats:
+    def __init__(self) -> None:
+        self.epochs: int = 0
+        self.restarts: int = 0
+        self.accuracy: float = 0
+
+    def __repr__(self) -> str:
+        return f"{self.epochs} epochs, {self.restarts} restarts, {self.accuracy * 100:.2f}% accuracy"
+
 class RecurrentNeuralNetwork:
     def __init__(
         self, input_size: int, hidden_size: int, output_size: int, *, 
         activation: typing.Callable = None, 
         activation_deriv: typing.Callable = None, 
-        output_activation: typing.Callable = None
+        output_activation: typing.Callable = None,
+        output_scale: float = 10
     ) -> None:
         self.input_state: list[int] = []
 
@@ -30,7 +55,8 @@ class RecurrentNeuralNetwork:
 
         self.activation = activation or np.tanh
         self.activation_derivative = activation_deriv or (lambda v: 1/np.cosh(v)**2) # d(tanhx)/dx = sech^2(x)
-        self.output_activation = output_activation or (lambda v: np.round(10 * v))
+        self.output_activation = output_activation or (lambda v: np.round(output_scale * v))
+        self.output_scale = output_scale  # What output_activation scales the raw output by, before rounding it (see train_on's loss)
         
         self.input_size = input_size
         self.hidden_size = hidden_size
@@ -46,6 +72,8 @@ class RecurrentNeuralNetwork:
         self.hidden_state: list[float] = None
         self.output_state: list[float] = None
 
+        self.epochs_trained: int = 0  # Epochs run by the latest call to train_on
+
     def backward_passes(self, inputs: DATASET, *, epochs: int = 5) -> None:
         """ 
             Backward passes and recomputes the weights and biases
@@ -92,7 +120,46 @@ class RecurrentNeuralNetwork:
             self.U -= ALPHA * (dU / length)
             self.b -= ALPHA * (db / length)
             self.c -= ALPHA * (dc / length)
-    
+
+    def batched_backward_passes(self, X: np.ndarray, Y: np.ndarray, *, epochs: int = 5) -> None:
+        """
+            Same as backward_passes, but computes the gradients of the whole dataset at once with matrix operations
+            Formulas used (under default conditions, one row per input):
+                Z = X * W + b
+                dY = 2 * (Y_hat - Y)
+                G = (dY * U^T) * sech^2(Z)
+                dW = X^T * G
+                dU = Z^T * dY
+                db = sum(G)
+                dc = sum(dY)
+
+            :param X: The stacked inputs, of shape (N, input_size) (see stack_dataset)
+            :param Y: The stacked expected outputs, of shape (N, output_size)
+            :param epochs: The number of times the model trains the set of inputs (default is 5)
+        """
+        length = len(X)
+        for _ in range(epochs):
+            try:
+                Z = np.dot(X, self.W) + self.b
+                H = self.activation(Z)
+                Y_hat = self.output_activation(np.dot(H, self.U) + self.c)
+
+                dY = 2 * (Y_hat - Y)
+                G = np.dot(dY, self.U.T) * self.activation_derivative(Z)
+
+                dW = np.dot(X.T, G)
+                dU = np.dot(Z.T, dY)
+                db = G.sum(axis=0)
+                dc = dY.sum(axis=0)
+            except RuntimeWarning:
+                raise RuntimeError  # RuntimeError when overflow
+
+            # Update our weights and biases
+            self.W -= ALPHA * (dW / length)
+            self.U -= ALPHA * (dU / length)
+            self.b -= ALPHA * (db / length)
+            self.c -= ALPHA * (dc / length)
+
     @property
     def activated_output(self) -> float:
         """ 
@@ -122,24 +189,98 @@ class RecurrentNeuralNetwork:
         self, dataset: DATASET, *, 
         epochs: int = EPOCHS,
         min_time: float = 1.5,
-        bar_length: int = 100
+        bar_length: int = 100,
+        batched: bool = True,
+        test_on: DATASET = None,
+        threshold: float = TESTING_THRESHOLD,
+        eval_interval: int = EVAL_INTERVAL,
+        patience: int = PATIENCE,
+        divergence: float = DIVERGENCE,
+        stop_when: typing.Callable[[], bool] = None
     ) -> None:
         """
             Trains the Recurrent NN model
+            Every `eval_interval` epochs, the loss and accuracy are checked:
+                accuracy >= threshold => stop training early
+                loss hasn't improved in `patience` checks => raise TrainingStalled (plateau)
+                loss is more than `divergence` times the best loss so far => raise TrainingStalled (diverging)
             
             :param dataset: The dataset on which to train the model on
             :param epochs: Number of epochs to train on
             :param min_time: Number of seconds to wait before updating progress bar (defaults to 1.5s)
             :param bar_length: Length of the progress bar (defaults to 100 characters)
+            :param batched: Whether to train on the whole dataset at once (defaults to True) or one input at a time
+            :param test_on: The dataset to check accuracy on (defaults to `dataset`)
+            :param threshold: The accuracy at which training stops early
+            :param eval_interval: Number of epochs between checks (0 disables checking)
+            :param patience: Number of checks without the loss improving before giving up
+            :param divergence: How many times the best loss the current loss can be before giving up
+            :param stop_when: Called after every epoch, training stops as soon as it returns True
         """
-        for _ in utils.Bar(rng=range(epochs), final_msg='training epochs', exit_msg='Training complete.', min_time=min_time, length=bar_length):
+        X, Y = stack_dataset(dataset, self.output_size)
+        test_X, test_Y = stack_dataset(test_on, self.output_size) if test_on else (X, Y)
+
+        self.epochs_trained = 0
+        best_loss: float = math.inf
+        stale_checks: int = 0
+        for epoch in utils.Bar(rng=range(epochs), final_msg='training epochs', exit_msg='Training complete.', min_time=min_time, length=bar_length):
             # Train while displaying progress bar
-            self.backward_passes(inputs=dataset)
+            if batched:
+                self.batched_backward_passes(X, Y)
+            else:
+                self.backward_passes(inputs=dataset)
+            self.epochs_trained += 1
+
+            if stop_when and stop_when():
+                return
+
+            if not eval_interval or (epoch + 1) % eval_interval:
+                continue
+
+            try:
+                # From the raw output, since the rounded one only moves in steps and would look stuck while training still improves it
+                loss = float(np.mean((self.output_scale * self.raw_output(X)[:, 0] - Y[:, 0]) ** 2))
+                accuracy = float(np.mean(self.predict_batch(test_X) == test_Y[:, 0]))
+            except RuntimeWarning:
+                raise RuntimeError  # RuntimeError when overflow
+
+            if accuracy >= threshold:
+                print(f"\nReached {utils.grade(accuracy * 100)} after {self.epochs_trained} epochs. Stopping early.")
+                return
+
+            if not math.isfinite(loss) or loss > divergence * best_loss:
+                raise TrainingStalled(f"loss diverged ({loss:.2f})")
+
+            if loss < best_loss:
+                best_loss, stale_checks = loss, 0
+            else:
+                stale_checks += 1
+                if stale_checks >= patience:
+                    raise TrainingStalled(f"loss plateaued ({loss:.2f})")
 
     def predict(self, inputs: list[int]) -> int:
         """ Predicts an output for the given input """
         self.input_state = inputs
         return self.activated_output[0]
+
+    def predict_batch(self, matrix: np.ndarray | list[list[int]]) -> np.ndarray:
+        """
+            Predicts outputs for many inputs at once, without touching the model's state (safe to share across threads)
+
+            :param matrix: The padded inputs, one per row, of shape (N, input_size)
+            :returns: The predictions, of shape (N,)
+        """
+        return self.output_activation(self.raw_output(matrix))[:, 0]
+
+    def raw_output(self, matrix: np.ndarray | list[list[int]]) -> np.ndarray:
+        """
+            Computes the outputs for many inputs at once, before output_activation
+
+            :param matrix: The padded inputs, one per row, of shape (N, input_size)
+            :returns: The outputs, of shape (N, output_size)
+        """
+        matrix = np.asarray(matrix, dtype=float).reshape((-1, self.input_size))
+        return np.dot(self.activation(np.dot(matrix, self.W) + self.b), self.U) + self.c
     
     def test(self, dataset: DATASET = None) -> float:
         """
@@ -149,21 +290,23 @@ class RecurrentNeuralNetwork:
             :returns: The accuracy of the model
         """
         dataset = dataset or data.DATA
-        results: list[bool] = []
-        for inp, out in dataset:
-            real: int = self.predict(inp)
-            results.append(real == out)
+        inputs, outputs = stack_dataset(dataset, self.output_size)
+        results: np.ndarray = self.predict_batch(inputs) == outputs[:, 0]
         
-        accuracy: float = sum(results)/len(dataset)
-        return accuracy
+        accuracy: float = results.sum()/len(dataset)
+        return float(accuracy)
     
     def train_test(
         self, train_on: DATASET, test_on: DATASET, *, 
         threshold: float = TESTING_THRESHOLD, 
         epochs: int = EPOCHS, 
         min_time: float = 1.5, 
-        bar_length: int = 100
-    ) -> None:
+        bar_length: int = 100,
+        batched: bool = True,
+        eval_interval: int = EVAL_INTERVAL,
+        patience: int = PATIENCE,
+        stop_when: typing.Callable[[], bool] = None
+    ) -> TrainingStats:
         """
             Trains and tests the model
             
@@ -172,23 +315,212 @@ class RecurrentNeuralNetwork:
             :param threshold: The minimum accuracy threshold to pass
             :param min_time: Number of seconds to wait before updating progress bar (defaults to 1.5s)
             :param bar_length: Length of the progress bar (defaults to 100 characters)
+            :param batched: Whether to train on the whole dataset at once (defaults to True) or one input at a time
+            :param eval_interval: Number of epochs between accuracy checks during training (0 disables early stopping)
+            :param patience: Number of checks without the loss improving before restarting
+            :param stop_when: Called after every epoch, training gives up (below the threshold) as soon as it returns True
+            :returns: The number of epochs and restarts the run used, and the final accuracy
         """
+        stats = TrainingStats()
         accuracy: float = 0
         while accuracy < threshold:
             try:
-                self.train_on(train_on, epochs=epochs, min_time=min_time, bar_length=bar_length)
+                self.train_on(
+                    train_on, epochs=epochs, min_time=min_time, bar_length=bar_length, batched=batched,
+                    test_on=test_on, threshold=threshold, eval_interval=eval_interval, patience=patience,
+                    stop_when=stop_when
+                )
+                stats.epochs += self.epochs_trained
                 accuracy = self.test(test_on)
                 print(f"Accuracy: {utils.grade(accuracy * 100)}")
+                if stop_when and stop_when():
+                    break
                 if accuracy < threshold:
                     if accuracy >= 0.5:
                         print("Continuing training")  # Satisfactory accuracy
                     else:
                         print("Restarting training.")  # Unsatisfactory accuracy
                         self.reset()
+                        stats.restarts += 1
             except RuntimeError:
                 # Instantly restart after overflow
-                print("Encountered overflow. Restarting training.")
+                print("\nEncountered overflow. Restarting training.")
+                stats.epochs += self.epochs_trained
+                self.reset()
+                stats.restarts += 1
+            except TrainingStalled as e:
+                print(f"\nTraining stalled: {e}. Restarting training.")
+                stats.epochs += self.epochs_trained
                 self.reset()
+                stats.restarts += 1
+
+        stats.accuracy = accuracy
+        print(f"Trained for {stats}")
+        return stats
+
+    def model_key(self, dataset: DATASET) -> str:
+        """
+            Hashes everything that decides what a trained model looks like
+
+            :param dataset: The dataset the model is trained on
+            :returns: A hex digest of the [query-analyzer] config, the layer sizes and the dataset
+        """
+        config = {key: value for key, value in analyzer_env.items() if key != 'MODEL_CACHE'}
+        payload = json.dumps({
+            'config': config,
+            'sizes': (self.input_size, self.hidden_size, self.output_size),
+            'dataset': dataset
+        }, sort_keys=True)
+
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def save(self, path: str, key: str) -> None:
+        """
+            Saves the weights and biases to an .npz file
+
+            :param path: The file to save to
+            :param key: The model key (from model_key) the weights were trained under
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, W=self.W, U=self.U, b=self.b, c=self.c, key=np.array(key))
+
+    def load(self, path: str, key: str) -> bool:
+        """
+            Loads the weights and biases from an .npz file, if it was saved under the same key
+
+            :param path: The file to load from
+            :param key: The model key (from model_key) the weights should have been trained under
+            :returns: Whether the weights were loaded or not
+        """
+        try:
+            with np.load(path) as saved:
+                if str(saved['key']) != key:
+                    return False  # Config or training data changed since the model was saved
+                W, U, b, c = saved['W'], saved['U'], saved['b'], saved['c']
+        except (OSError, KeyError, ValueError):
+            return False  # Missing or unreadable file
+
+        if (W.shape, U.shape, b.shape, c.shape) != (self.W.shape, self.U.shape, self.b.shape, self.c.shape):
+            return False
+
+        self.W, self.U, self.b, self.c = W, U, b, c
+        return True
+
+    def train_or_load(self, train_on: DATASET, test_on: DATASET, *, path: str = MODEL_CACHE, workers: int = 1, threshold: float = TESTING_THRESHOLD, **kwargs) -> bool:
+        """
+            Loads a previously trained model, training (and saving) a new one if there isn't an up-to-date one.
+            A model that stopped short of the threshold (its time budget ran out) is used but not saved, so the next start trains again
+
+            :param train_on: The dataset to train the model on
+            :param test_on: The dataset to test the model on
+            :param path: The file the model is saved to (defaults to MODEL_CACHE from config.toml)
+            :param workers: Number of differently seeded models to train in parallel (see train_parallel)
+            :param threshold: The minimum accuracy threshold to pass
+            :param kwargs: Passed on to train_test (or train_parallel)
+            :returns: Whether the model was loaded from disk (True) or trained (False)
+        """
+        key = self.model_key(train_on)
+        if self.load(path, key):
+            return True
+
+        if workers > 1:
+            trained = train_parallel(self.input_size, self.hidden_size, self.output_size, train_on, test_on, workers=workers, threshold=threshold, **kwargs)
+            self.W, self.U, self.b, self.c = trained.W, trained.U, trained.b, trained.c
+            stats = trained.stats
+        else:
+            stats = self.train_test(train_on, test_on, threshold=threshold, **kwargs)
+
+        if stats.accuracy >= threshold:
+            self.save(path, key)
+        return False
+
+_stop_event = None  # Set in each worker process by _init_worker
+
+def _init_worker(stop_event) -> None:
+    global _stop_event
+    _stop_event = stop_event
+    sys.stdout = open(os.devnull, 'w')  # Keep the workers' progress bars from interleaving
+
+def _train_seeded(seed: int, sizes: tuple[int, int, int], train_on: DATASET, test_on: DATASET, deadline: float, kwargs: dict) -> tuple[int, TrainingStats, dict]:
+    """
+        Trains one seeded model in a worker process
+
+        :returns: The seed, the training stats, and the trained weights and biases
+    """
+    np.random.seed(seed)
+    model = RecurrentNeuralNetwork(*sizes)
+    stats = model.train_test(
+        train_on, test_on,
+        stop_when=lambda: _stop_event.is_set() or (deadline is not None and time.time() >= deadline),
+        **kwargs
+    )
+    return seed, stats, {'W': model.W, 'U': model.U, 'b': model.b, 'c': model.c}
+
+def train_parallel(
+    input_size: int, hidden_size: int, output_size: int, train_on: DATASET, test_on: DATASET, *,
+    workers: int = None,
+    seeds: list[int] = None,
+    time_budget: float = None,
+    threshold: float = TESTING_THRESHOLD,
+    **kwargs
+) -> RecurrentNeuralNetwork:
+    """
+        Trains several independently seeded models across a process pool.
+        Keeps the first one to pass the threshold, or the most accurate one once every seed has given up or the time budget runs out.
+
+        :param input_size: The input size of the models
+        :param hidden_size: The hidden size of the models
+        :param output_size: The output size of the models
+        :param train_on: The dataset to train the models on
+        :param test_on: The dataset to test the models on
+        :param workers: Number of processes (defaults to the number of CPUs)
+        :param seeds: The seeds to train with, one model per seed (defaults to 0, 1, ..., workers - 1)
+        :param time_budget: Number of seconds after which every model stops training (defaults to no limit)
+        :param threshold: The minimum accuracy threshold to pass
+        :param kwargs: Passed on to RecurrentNeuralNetwork.train_test
+        :returns: The chosen model, with its seed and training stats as `seed` and `stats`
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(workers)) if seeds is None else list(seeds)
+    deadline = time.time() + time_budget if time_budget is not None else None
+
+    stop_event = multiprocessing.Event()
+    best: tuple[int, TrainingStats, dict] = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stop_event,)) as pool:
+        futures = [
+            pool.submit(_train_seeded, seed, (input_size, hidden_size, output_size), train_on, test_on, deadline, dict(kwargs, threshold=threshold))
+            for seed in seeds
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if best is None or result[1].accuracy > best[1].accuracy:
+                best = result
+            if best[1].accuracy >= threshold:
+                stop_event.set()  # Tell the other workers to give up
+                for other in futures:
+                    other.cancel()
+                break
+
+    seed, stats, weights = best
+    print(f"Kept seed {seed}: {stats}")
+
+    model = RecurrentNeuralNetwork(input_size, hidden_size, output_size)
+    model.W, model.U, model.b, model.c = weights['W'], weights['U'], weights['b'], weights['c']
+    model.seed, model.stats = seed, stats
+    return model
+
+def stack_dataset(dataset: DATASET, output_size: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Stacks a dataset into matrices for RecurrentNeuralNetwork.batched_backward_passes
+
+        :param dataset: The dataset to stack
+        :param output_size: The output size of the model
+        :returns: The inputs as an (N, input_size) matrix, and the outputs as an (N, output_size) matrix
+    """
+    X = np.array([x for x, _ in dataset], dtype=float)
+    Y = np.array([y for _, y in dataset], dtype=float).reshape((len(dataset), output_size))
+    return X, Y
 
 def interpret_prediction(prediction: int, sentence: list[int]) -> utils.WordShell | list[utils.WordShell]:
     """
@@ -205,7 +537,10 @@ def interpret_prediction(prediction: int, sentence: list[int]) -> utils.WordShel
     """
     primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
     results: list[int] = []  # The primes that factor our prediction
+    if prediction < 2:
+        return -1  # Error, would never factor down to 1
     while prediction != 1:
+        factored = len(results)
         for i, prime in enumerate(primes):
             if prediction % prime == 0:
                 results.append(i)
@@ -213,6 +548,8 @@ def interpret_prediction(prediction: int, sentence: list[int]) -> utils.WordShel
             
             if prediction == 1:  # Break when the prediction becomes 1
                 break
+        if len(results) == factored:
+            return -1  # Error, has a prime factor larger than 29
     try:
         if len(results) == 1:
             return sentence[results[0]]  # Return a single word
@@ -1,34 +1,196 @@
 import requests
+import requests.adapters
+import urllib3.util
 import bs4
+import html.parser
 import utils
+import cache
 import typing
+import queue
+import time
+import concurrent.futures
 
-def text_similarity(a: str, b: str) -> float:
+scraper_env = utils.PROJECT.SCRAPER
+
+TIMEOUT = scraper_env['TIMEOUT']
+REQUEST_TIMEOUT = scraper_env['REQUEST_TIMEOUT']
+POOL_SIZE = scraper_env['POOL_SIZE']
+RETRIES = scraper_env['RETRIES']
+BACKOFF = scraper_env['BACKOFF']
+CHUNK_SIZE = 16384
+USER_AGENT = 'wikibot/0.0.1 (https://github.com/tathyagarg/wikibot)'
+API_BATCH_SIZE = 20  # The most extracts the MediaWiki API returns per request
+
+class Session(requests.Session):
+    """ A requests.Session that applies a default timeout to every request """
+    def __init__(self, timeout: float = REQUEST_TIMEOUT) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+def make_session(*, pool_size: int = POOL_SIZE, retries: int = RETRIES, backoff: float = BACKOFF, timeout: float = REQUEST_TIMEOUT) -> Session:
+    """
+        Makes a keep-alive session with pooled connections, which the ScrapeSites share
+
+        :param pool_size: Number of connections kept open per host
+        :param retries: Number of times a failed request is retried
+        :param backoff: Backoff factor between retries, in seconds (waits backoff, 2*backoff, 4*backoff, ...)
+        :param timeout: Number of seconds to wait for a response
+        :returns: The session
     """
-        Gets the Levenshtein distance between 2 strings
+    retry = urllib3.util.Retry(
+        total=retries, backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('HEAD', 'GET')
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = Session(timeout=timeout)
+    session.headers['User-Agent'] = USER_AGENT
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def text_similarity(a: str, b: str, *, bound: int = None) -> int:
+    """
+        Gets the Levenshtein distance between 2 strings.
+        Only keeps two rows of the distance table, and only fills in the cells within `bound` of the diagonal, stopping as soon as every cell in a row reaches `bound`.
 
         :param a: The first string
         :param b: The second string
-        :returns: The Levenshtein distance between string `a` and `b`
+        :param bound: Distances of `bound` or more are all reported as `bound` (defaults to no bound)
+        :returns: The Levenshtein distance between string `a` and `b`, capped at `bound`
     """
+    if len(a) < len(b): a, b = b, a  # Make `b` the shorter string, so the rows are as short as possible
+    if bound is None: bound = len(a) + 1  # The distance is never more than len(a)
+    if len(a) - len(b) >= bound: return bound
     if len(b) == 0: return len(a)
-    if len(a) == 0: return len(b)
-    if a[0] == b[0]: return text_similarity(a[1:], b[1:])
-    return 1 + min([
-        text_similarity(a[1:], b),
-        text_similarity(a, b[1:]),
-        text_similarity(a[1:], b[1:])
-    ])
-
-def columbia_encyclopedia(host_scheme: str, query: str, *, limit: int = 1) -> typing.Generator[str, None, list]:
+
+    # Cells outside the band are at least `bound` away. The band only moves right, so reusing the rows only leaves stale cells at its left edge
+    previous: list[int] = [j if j < bound else bound for j in range(len(b) + 1)]
+    current: list[int] = [bound] * (len(b) + 1)
+    for i, character in enumerate(a, 1):
+        low = max(1, i - bound + 1)
+        high = min(len(b), i + bound - 1)
+
+        left = current[low - 1] = i if low == 1 and i < bound else bound
+        diagonal = previous[low - 1]
+        smallest = left
+        for j in range(low, high + 1):
+            up = previous[j]
+            cell = diagonal if character == b[j - 1] else diagonal + 1  # Substitution
+            if up < cell: cell = up + 1  # Deletion
+            if left < cell: cell = left + 1  # Insertion
+            if cell > bound: cell = bound
+            if cell < smallest: smallest = cell
+            current[j] = left = cell
+            diagonal = up
+
+        if smallest >= bound:
+            return bound  # Every path through this row is already too long
+        previous, current = current, previous
+
+    return previous[-1]
+
+class ParagraphExtractor(html.parser.HTMLParser):
+    def __init__(self, tag: str, class_: str, *, limit: int = 1) -> None:
+        """
+            Incrementally collects the text of the <p> elements inside the first `tag` with class `class_`.
+            Feed it the page in chunks, and stop feeding once `done` is True.
+
+            :param tag: The tag of the container. Eg. div
+            :param class_: A class of the container. Eg. mw-content-ltr
+            :param limit: The number of (non-empty) paragraphs to collect
+        """
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.class_ = class_
+        self.limit = limit
+
+        self.paragraphs: list[str] = []
+        self.closed: bool = False  # Whether we've gone past the end of the container
+
+        self._depth: int = 0  # How many `tag`s deep inside the container we are, 0 when outside
+        self._text: list[str] = None  # Text of the current paragraph, None when outside a paragraph
+
+    @property
+    def done(self) -> bool:
+        return self.closed or len(self.paragraphs) >= self.limit
+
+    def _end_paragraph(self) -> None:
+        text = ''.join(self._text).strip()
+        self._text = None
+        if text and not self.done:
+            self.paragraphs.append(text)
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if self.done:
+            return
+
+        if not self._depth:
+            if tag == self.tag and self.class_ in (dict(attrs).get('class') or '').split():
+                self._depth = 1  # Entered the container
+            return
+
+        if tag == self.tag:
+            self._depth += 1
+        if tag == 'p':
+            if self._text is not None:
+                self._end_paragraph()  # Unclosed <p>
+            self._text = []
+
+    def handle_endtag(self, tag) -> None:
+        if not self._depth:
+            return
+
+        if tag == 'p' and self._text is not None:
+            self._end_paragraph()
+        elif tag == self.tag:
+            if self._text is not None:
+                self._end_paragraph()  # Unclosed <p>
+            self._depth -= 1
+            if not self._depth:
+                self.closed = True
+
+    def handle_data(self, data) -> None:
+        if self._text is not None:
+            self._text.append(data)
+
+def extract_paragraphs(url: str, tag: str, class_: str, *, limit: int = 1, session: requests.Session = None) -> list[str]:
+    """
+        Streams a page, and stops downloading and parsing it as soon as the paragraphs we want are found
+
+        :param url: The url of the page
+        :param tag: The tag of the container of the paragraphs. Eg. div
+        :param class_: A class of the container of the paragraphs. Eg. mw-content-ltr
+        :param limit: The number of (non-empty) paragraphs to extract
+        :param session: The session to make requests with (defaults to a new connection)
+        :returns: The text of up to `limit` paragraphs inside the first matching container
+    """
+    extractor = ParagraphExtractor(tag, class_, limit=limit)
+    with (session or requests).get(url, stream=True) as response:
+        response.encoding = response.encoding or 'utf-8'
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=True):
+            extractor.feed(chunk)
+            if extractor.done:
+                break
+
+    return extractor.paragraphs
+
+def columbia_encyclopedia(host_scheme: str, query: str, *, limit: int = 1, session: requests.Session = None) -> typing.Generator[str, None, list]:
     """
         Scrapes data from Columbia Encyclopedia regarding the query
         
         :param host_scheme: The host url of Columbia Encyclopedia (https://www.infoplease.com)
         :param query: The query to search for
         :param limit: The number of results to return
+        :param session: The session to make requests with (defaults to a new connection per request)
         :returns: A generator of the contents of relevant pages
     """
+    session = session or requests
     def loose_search() -> typing.Generator[str, None, list]:
         """
             Searches the encyclopedia to get links to relevant pages
@@ -36,11 +198,11 @@ def columbia_encyclopedia(host_scheme: str, query: str, *, limit: int = 1) -> ty
             :returns: A generator of sub-links. Eg. /ice-cream
         """
         url = f'{host_scheme.strip("/")}/search/encyclopedia/{"+".join(query.lower().split())}'
-        soup = bs4.BeautifulSoup(requests.get(url).text, 'html.parser')
+        soup = bs4.BeautifulSoup(session.get(url).text, 'html.parser', parse_only=bs4.SoupStrainer('article', class_='contextual-region'))
         iterator = iter(soup.find_all('article', class_='contextual-region'))
         for _ in range(limit):  # Yield only `limit` number of links or fewer
             a = next(iterator).h2.a
-            if text_similarity(a.text, query) < 5:
+            if text_similarity(a.text, query, bound=5) < 5:
                 yield a['href']
             else:
                 return []
@@ -48,82 +210,180 @@ def columbia_encyclopedia(host_scheme: str, query: str, *, limit: int = 1) -> ty
     try:
         for href in loose_search():
             url = f'{host_scheme.strip("/")}/{href.strip("/")}'  # Constructed page url
-            yield bs4.BeautifulSoup(requests.get(url).text, 'html.parser').find_all('div', class_='article-detail')[0].div.p.text.strip()
+            yield extract_paragraphs(url, 'div', 'article-detail', session=session)[0]
     except RuntimeError:
         return []
 
-def wikipedia(host_scheme: str, query: str, *, limit: int = 1) -> typing.Generator[str, None, None]:
+def wikipedia(host_scheme: str, query: str, *, limit: int = 1, session: requests.Session = None) -> typing.Generator[str, None, None]:
     """
         Scrapes data from Wikipedia regarding the query
         
         :param host_scheme: The host url of Wikipedia (https://en.wikipedia.org)
         :param query: The query to search for
         :param limit: The number of results to return
+        :param session: The session to make requests with (defaults to a new connection per request)
         :returns: A generator of the contents of relevant pages
     """
-    def empty_filter(content) -> str:
-        # Returns the text of a tag, empty string if the content is empty or spaces.
-        return content.text.strip()
-
+    session = session or requests
     def loose_search() -> tuple[list[str], int]:
         """
             Searches wikipedia to get links to relevant pages
 
-            :returns: A list of sub-links, and a number denoting whether we got redirected or not.
+            :returns: A list of sub-links (or paragraphs, if we got redirected), and a number denoting whether we got redirected or not.
         """
         url = f"{host_scheme.strip('/')}/wiki/Special:Search?search={'+'.join(query.lower().split())}&ns0=1"
-        resp = requests.head(url, allow_redirects=True)
+        resp = session.head(url, allow_redirects=True)
         if resp.url != url:  # We got redirected!
-            url = resp.url
-            return ( 
-                list(filter(empty_filter, bs4.BeautifulSoup(requests.get(url).text, 'html.parser').find_all('div', class_='mw-content-ltr')[0].find_all('p')))[:limit],
-                1
-            )
+            return extract_paragraphs(resp.url, 'div', 'mw-content-ltr', limit=limit, session=session), 1
         else:
-            soup = bs4.BeautifulSoup(requests.get(url).text, 'html.parser')
+            soup = bs4.BeautifulSoup(session.get(url).text, 'html.parser', parse_only=bs4.SoupStrainer('div', class_='mw-search-result-heading'))
             iterator = iter(soup.find_all('div', class_='mw-search-result-heading'))
             return [next(iterator).a['href']for _ in range(limit)], 0
 
     contents, redirected = loose_search()
     if redirected:
-        for content in contents:
-            yield empty_filter(content)
+        yield from contents
     else:
         for href in contents:
             url = f'{host_scheme.strip("/")}/{href.strip("/")}'
-            yield bs4.BeautifulSoup(requests.get(url).text, 'html.parser').find_all('div', class_='mw-content-ltr')[0].p.text.strip()
+            yield extract_paragraphs(url, 'div', 'mw-content-ltr', session=session)[0]
+
+def _first_paragraph(extract: str) -> str:
+    # Plain text extracts separate paragraphs with newlines
+    return next((line.strip() for line in extract.split('\n') if line.strip()), '')
+
+def wikipedia_api(host_scheme: str, query: str, *, limit: int = 1, session: requests.Session = None) -> typing.Generator[str, None, None]:
+    """
+        Gets data from Wikipedia regarding the query through the MediaWiki API.
+        A single request searches for the query, follows redirects and returns plain text extracts, so no HTML is parsed.
 
+        :param host_scheme: The host url of Wikipedia (https://en.wikipedia.org)
+        :param query: The query to search for
+        :param limit: The number of results to return
+        :param session: The session to make requests with (defaults to a new connection per request)
+        :returns: A generator of the lead paragraphs of relevant pages
+    """
+    session = session or requests
+    response = session.get(f"{host_scheme.strip('/')}/w/api.php", params={
+        'action': 'query',
+        'format': 'json',
+        'formatversion': 2,
+        'generator': 'search',
+        'gsrsearch': query,
+        'gsrnamespace': 0,
+        'gsrlimit': limit,
+        'prop': 'extracts',
+        'exintro': 1,
+        'explaintext': 1,
+        'exlimit': limit,
+        'redirects': 1
+    })
+    response.raise_for_status()
+
+    pages = response.json().get('query', {}).get('pages', [])
+    for page in sorted(pages, key=lambda page: page.get('index', 0)):  # Pages come back unordered
+        paragraph = _first_paragraph(page.get('extract', ''))
+        if paragraph:
+            yield paragraph
+
+def wikipedia_extracts(host_scheme: str, titles: list[str], *, session: requests.Session = None) -> dict[str, str]:
+    """
+        Gets the lead paragraphs of several Wikipedia articles by title, batching as many titles per request as the API allows
+
+        :param host_scheme: The host url of Wikipedia (https://en.wikipedia.org)
+        :param titles: The titles of the articles
+        :param session: The session to make requests with (defaults to a new connection per request)
+        :returns: The lead paragraph of each title that has an article, keyed by the title as given
+    """
+    session = session or requests
+    results: dict[str, str] = {}
+    for start in range(0, len(titles), API_BATCH_SIZE):
+        batch = titles[start:start + API_BATCH_SIZE]
+        response = session.get(f"{host_scheme.strip('/')}/w/api.php", params={
+            'action': 'query',
+            'format': 'json',
+            'formatversion': 2,
+            'titles': '|'.join(batch),
+            'prop': 'extracts',
+            'exintro': 1,
+            'explaintext': 1,
+            'exlimit': len(batch),
+            'redirects': 1
+        })
+        response.raise_for_status()
+        body = response.json().get('query', {})
+
+        # Map the titles we asked for onto the titles of the pages we got back
+        resolved = {title: title for title in batch}
+        for step in ('normalized', 'redirects'):
+            renames = {item['from']: item['to'] for item in body.get(step, [])}
+            resolved = {title: renames.get(target, target) for title, target in resolved.items()}
+
+        extracts = {page['title']: page.get('extract', '') for page in body.get('pages', []) if not page.get('missing')}
+        for title, target in resolved.items():
+            paragraph = _first_paragraph(extracts.get(target, ''))
+            if paragraph:
+                results[title] = paragraph
+
+    return results
 
 class ScrapeSite:
-    def __init__(self, host_scheme: str, search_on: typing.Callable = None) -> None:
+    def __init__(self, host_scheme: str, search_on: typing.Callable = None, session: requests.Session = None, cache: cache.ScrapeCache = None) -> None:
         self.host_scheme = host_scheme
         self.search_on = search_on  # Search function
+        self.session = session  # Set by Scraper if None
+        self.cache = cache  # Set by Scraper if None
 
     def fetch(self, query: str, *, limit: int = 1) -> typing.Generator[str, None, list]:
         """
-            Fetches result from its respective site.
+            Fetches result from its respective site, or from the cache if the query was searched for recently.
 
             :param query: The query to search for
             :param limit: The number of pages to search
             :returns: A generator of contents of relevant pages
         """
-        yield from self.search_on(self.host_scheme, query, limit=limit)
+        if self.cache is not None:
+            cached = self.cache.get(self.host_scheme, query, limit)
+            if cached is not None:
+                yield from cached
+                return
+
+        results: list[str] = []
+        for result in self.search_on(self.host_scheme, query, limit=limit, session=self.session):
+            results.append(result)
+            yield result
+
+        if self.cache is not None and results:
+            self.cache.put(self.host_scheme, query, limit, results)
 
 class Scraper:
-    def __init__(self, scrapers: list[ScrapeSite] = None) -> None:
+    def __init__(self, scrapers: list[ScrapeSite] = None, session: requests.Session = None, cache: cache.ScrapeCache = None) -> None:
         self.scrapers = scrapers or \
-            [ScrapeSite('https://www.infoplease.com', columbia_encyclopedia), ScrapeSite('https://en.wikipedia.org', wikipedia)]
+            [ScrapeSite('https://www.infoplease.com', columbia_encyclopedia), ScrapeSite('https://en.wikipedia.org', wikipedia_api)]
+
+        self.session = session or make_session()
+        self.cache = cache
+        for site in self.scrapers:
+            if site.session is None:
+                site.session = self.session  # Every site shares one connection pool
+            if site.cache is None:
+                site.cache = self.cache
 
-    def fetch_results(self, query: str, *, limit: int = 1) -> list[str]:
+    def fetch_results(self, query: str, *, limit: int = 1, parallel: bool = True, timeout: float = TIMEOUT) -> list[str]:
         """
             Gets contents relevant to the query from all the ScrapeSites
 
             :param query: The query to search for
             :param limit: The number of pages to search
+            :param parallel: Whether to search all the ScrapeSites at once (defaults to True) or one after the other
+            :param timeout: Number of seconds to wait for the ScrapeSites when searching concurrently
             :returns: A list of contents from all the ScrapeSites
         """
         while True:
             try:
+                if parallel:
+                    return self.fetch_concurrently(query, limit=limit, timeout=timeout)
+
                 results: list[str] = []
                 for scraper_idx in utils.Bar(range(len(self.scrapers)), 'sites searched', 'Searching complete.'):
                     for result in self.scrapers[scraper_idx].fetch(query, limit=limit):
@@ -135,3 +395,87 @@ class Scraper:
                 if not input("\nDon't enter anything to continue: "):
                     continue
                 return
+
+    def fetch_concurrently(self, query: str, *, limit: int = 1, timeout: float = TIMEOUT) -> list[str]:
+        """
+            Searches all the ScrapeSites at once, each on its own thread.
+            Sites that fail or haven't finished within `timeout` seconds are skipped, without holding up the others.
+
+            :param query: The query to search for
+            :param limit: The number of pages to search
+            :param timeout: Number of seconds to wait for the ScrapeSites
+            :returns: A list of contents from the ScrapeSites, in the same order as self.scrapers
+        """
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.scrapers) or 1)
+        futures = [pool.submit(lambda site: list(site.fetch(query, limit=limit)), site) for site in self.scrapers]
+        concurrent.futures.wait(futures, timeout=timeout)
+        pool.shutdown(wait=False, cancel_futures=True)  # Don't wait on sites that timed out
+
+        results: list[str] = []
+        for site, future in zip(self.scrapers, futures):
+            if not future.done():
+                print(f"{site.host_scheme} timed out.")
+                continue
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"{site.host_scheme} failed: {e!r}")
+
+        return results
+
+    def stream(self, query: str, *, limit: int = 1, timeout: float = TIMEOUT) -> typing.Generator[str, None, None]:
+        """
+            Searches all the ScrapeSites at once, each on its own thread, and yields results while the slower sites are still being searched.
+            Results come out in the same order as fetch_concurrently's (self.scrapers order): a site's results are passed on as soon as they come in if every site before it is done, and held back until then otherwise.
+            Sites that fail are skipped, and the stream ends after `timeout` seconds, with the results of the sites that finished by then.
+
+            :param query: The query to search for
+            :param limit: The number of pages to search
+            :param timeout: Number of seconds to wait for the ScrapeSites
+            :returns: A generator of contents from the ScrapeSites
+        """
+        results: queue.Queue[tuple[int, str | None]] = queue.Queue()
+
+        def search(index: int) -> None:
+            site = self.scrapers[index]
+            try:
+                for result in site.fetch(query, limit=limit):
+                    results.put((index, result))
+            except Exception as e:
+                print(f"{site.host_scheme} failed: {e!r}")
+            finally:
+                results.put((index, None))  # This site is done
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.scrapers) or 1)
+        for index in range(len(self.scrapers)):
+            pool.submit(search, index)
+        pool.shutdown(wait=False)
+
+        held: list[list[str]] = [[] for _ in self.scrapers]  # Results that came in before their turn
+        done = [False] * len(self.scrapers)
+        current = 0  # The site whose results are being passed on
+        deadline = time.monotonic() + timeout
+        while True:
+            while current < len(self.scrapers):
+                yield from held[current]
+                held[current] = []
+                if not done[current]:
+                    break
+                current += 1
+            if current == len(self.scrapers):
+                return
+
+            try:
+                index, result = results.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                for index in range(current, len(self.scrapers)):
+                    if done[index]:
+                        yield from held[index]
+                    else:
+                        print(f"{self.scrapers[index].host_scheme} timed out.")
+                return
+
+            if result is None:
+                done[index] = True
+            else:
+                held[index].append(result)
@@ -0,0 +1,59 @@
+import asyncio
+import sys
+import pipeline
+
+HOST = '127.0.0.1'
+PORT = 8642
+
+async def serve(bot: pipeline.Pipeline, host: str = HOST, port: int = PORT) -> None:
+    """
+        Serves queries over a line protocol: each line sent is a query, and each query is answered with one "query<TAB>answer" line (answers may come back in a different order).
+        Every connection (and every query) is handled concurrently, sharing the same pipeline.
+
+        :param bot: The pipeline to answer with
+        :param host: The host to listen on
+        :param port: The port to listen on
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        lock = asyncio.Lock()  # Answers may finish out of order, but each is written as a whole line
+
+        async def reply(query: str) -> None:
+            try:
+                answer = await bot.answer_async(query)
+            except Exception as e:
+                answer = f"Error: {e!r}"
+            async with lock:
+                try:
+                    writer.write(f"{query}\t{' '.join(answer.split())}\n".encode())
+                    await writer.drain()
+                except ConnectionError:
+                    pass  # The client went away, so nobody is waiting for the answer
+
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                query = line.decode(errors='replace').strip()
+                if query:
+                    task = asyncio.create_task(reply(query))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except (ConnectionError, ValueError):
+            pass  # The connection was reset, or a line was longer than the reader's limit
+        finally:
+            # If reading failed, the replies still going can't be written anymore
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    # python server.py [host] [port]
+    host = sys.argv[1] if len(sys.argv) > 1 else HOST
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    asyncio.run(serve(pipeline.load(), host, port))
@@ -1,10 +1,87 @@
+import bisect
+import collections
+import itertools
+import math
 import random
 import string
+import threading
+import time
+import typing
+import numpy as np
+import ngram
+import utils
+
+text_gen_env = utils.PROJECT.TEXT_GEN
+
+SENTENCES = text_gen_env['SENTENCES']
+MAX_TOKENS = text_gen_env['MAX_TOKENS']
+TIME_BUDGET = text_gen_env['TIME_BUDGET']
+
+SEARCH_STEP = 1024  # Words TextGenerator.distances looks at between checks of its deadline
+SAMPLE_TRIES = 8  # Draws TextGenerator.sample_within makes before it sorts out which words fit
+
+TERMINALS = frozenset('.!?')  # Punctuation that ends a sentence
+OPENING = frozenset(['(', '[', '{', '``'])  # Punctuation that sticks to the word after it
 
 class TextGenerator:
-    def __init__(self, starting_word: str, trigrams: dict[str, dict[str, dict[str, float]]]) -> None:
+    def __init__(self, starting_word: str, trigrams: dict[str, dict[str, dict[str, float]]], *, seed: int = None) -> None:
+        """
+            Generates text from trigram probabilities.
+            The cumulative weights of every (prev2, prev) context are worked out once here, so drawing a word is one bisect over its context's range.
+
+            :param starting_word: The first word of every sentence
+            :param trigrams: The probabilities as nested dicts of prev2 -> prev -> curr -> probability
+            :param seed: The seed for the random number generator (defaults to a random seed)
+        """
         self.starting_word = starting_word
-        self.trigrams = trigrams  # Lots of nesting!
+        self.trigrams = trigrams  # Lots of nesting! (empty when made with from_trigrams)
+        self.rng = random.Random(seed)
+
+        # Every context's words and running weights are laid out back to back, and contexts[prev2][prev] is the (start, end) of its range
+        self.words: list[str] = []
+        self.cumulative: list[float] = []
+        self.contexts: dict[str, dict[str, tuple[int, int]]] = {}
+        self.seconds: dict[str, list[str]] = {}  # The words that can follow each first word
+        for prev2, following in trigrams.items():
+            self.seconds[prev2] = list(following.keys())
+            ranges = self.contexts[prev2] = {}
+            for prev, probabilities in following.items():
+                start = len(self.words)
+                self.words.extend(probabilities.keys())
+                self.cumulative.extend(itertools.accumulate(probabilities.values()))
+                ranges[prev] = (start, len(self.words))
+
+        self._distances: list[int] = None
+        self._distance_search: typing.Generator[None, None, list[int]] = None  # The search for _distances, while it's unfinished
+        self._distance_lock = threading.Lock()  # One TextGenerator may be shared by concurrent requests
+
+    @classmethod
+    def from_trigrams(cls, trigrams: ngram.Trigrams, *, seed: int = None) -> 'TextGenerator':
+        """
+            Makes a TextGenerator straight out of the sorted arrays of ngram.Trigrams, without going through nested dicts (Trigrams.grams).
+            Every context is already one range of the arrays, so the ranges are the same and the running weights are the counts summed per range.
+
+            :param trigrams: The trigrams
+            :param seed: The seed for the random number generator (defaults to a random seed)
+            :returns: The TextGenerator
+        """
+        speaker = cls(trigrams.first, {}, seed=seed)
+        starts = trigrams.context_starts()
+        keys, counts, vocabulary = trigrams.keys, trigrams.counts, trigrams.vocabulary
+        if not len(starts):
+            return speaker
+
+        running = np.cumsum(counts)
+        lengths = np.diff(np.append(starts, len(keys)))
+        speaker.words = [vocabulary[word_id] for word_id in (keys & ngram.ID_MASK).tolist()]
+        speaker.cumulative = (running - np.repeat(running[starts] - counts[starts], lengths)).astype(float).tolist()
+
+        bounds = starts.tolist() + [len(keys)]
+        for index, key in enumerate((keys[starts] >> ngram.ID_BITS).tolist()):
+            prev2, prev = vocabulary[key >> ngram.ID_BITS], vocabulary[key & ngram.ID_MASK]
+            speaker.contexts.setdefault(prev2, {})[prev] = (bounds[index], bounds[index + 1])
+        speaker.seconds = {prev2: list(ranges.keys()) for prev2, ranges in speaker.contexts.items()}
+        return speaker
 
     def fetch_second_word(self, prev: str) -> str:
         """
@@ -13,7 +90,17 @@ class TextGenerator:
             :param prev: The previous word (First word)
             :returns: The second word
         """
-        return random.choice(list(self.trigrams[prev].keys()))
+        return self.rng.choice(self.seconds[prev])
+
+    def sample(self, start: int, end: int) -> str:
+        """
+            Draws a word from a context's range, weighted by probability
+
+            :param start: The start of the range
+            :param end: The end of the range
+            :returns: The word
+        """
+        return self.words[bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[end - 1], start, end - 1)]
 
     def speak_from_word(self, prev2: str = None, prev: str = None) -> str | tuple[str, int]:
         """
@@ -29,46 +116,319 @@ class TextGenerator:
         if prev2 is None:  # Second word!
             return self.fetch_second_word(prev)
         
-        if prev not in self.trigrams.get(prev2, []) or prev2 not in self.trigrams:  # Last word!
+        context = self.contexts.get(prev2)
+        if context is None or prev not in context:  # Last word!
             return '', 1
         
-        return random.choices(list(self.trigrams[prev2][prev].keys()), weights=list(self.trigrams[prev2][prev].values()))[0], 0
+        return self.sample(*context[prev]), 0
 
 
     def speak_sentence(self) -> None:
         """
-            Prints out a sentence of spoken words
+            Prints out a sentence of spoken words, word by word as they're spoken
+        """
+        for piece in detokenize(self.iter_sentence()):
+            print(piece, end='', flush=True)
+        print()
+
+    def iter_sentence(self) -> typing.Generator[str, None, None]:
+        """
+            Speaks a sentence
+
+            :returns: A generator of the spoken words (and punctuation), ending with the '' end marker
         """
-        result: list[str] = []
         prev2 = self.speak_from_word()  # prev2 from context of the 3rd word
         prev = self.speak_from_word(None, prev2)  # prev from context of the 3rd word
         # (we ignore the status return because it doesn't return a status at this point) ^^^
-        result.append(prev2)
-        result.append(prev)
+        yield prev2
+        yield prev
         while True:
             curr, status = self.speak_from_word(prev2, prev)
-            result.append(curr)
+            yield curr
             if status:  # if status == 1:
                 break
             prev2, prev = prev, curr
 
-        print(formatted(result))
+    def generate_tokens(self, *, sentences: int = SENTENCES, max_tokens: int = MAX_TOKENS, time_budget: float = TIME_BUDGET, prefer_terminal: bool = False) -> typing.Generator[str, None, None]:
+        """
+            Speaks several sentences within a budget. Unlike iter_sentence, this always ends, even when the trigrams loop back on themselves.
+            A sentence ends on terminal punctuation, or at a context nothing follows, where a full stop is added and the next sentence starts over from the starting word.
+            With prefer_terminal, the next sentence also starts over if the one that follows wouldn't fit in the tokens left but one from the starting word would.
+
+            :param sentences: Number of sentences to speak
+            :param max_tokens: Most words (and punctuation) to speak
+            :param time_budget: Most seconds to spend speaking, None for no limit
+            :param prefer_terminal: Whether to only draw words that leave enough tokens to end their sentence (see sample_within), instead of being cut off mid-sentence.
+                This needs distances(), which get the first half of `time_budget` and speaking the second. If that isn't enough to finish them, words are drawn as usual, and the search carries on during the next call
+            :returns: A generator of the spoken words (and punctuation)
+        """
+        started = time.monotonic()
+        distances = self.distances(deadline=started + time_budget / 2 if time_budget is not None else None) if prefer_terminal else None
+        # Speaking always gets at least the second half, even if a step of the search ran over the first
+        deadline = max(started + time_budget, time.monotonic() + time_budget / 2) if time_budget is not None else None
+        finished = 0
+        spoken = 0
+        prev2 = prev = None
+
+        def keep_going(prev2: str, prev: str, left: int) -> bool:
+            # Called whenever a sentence ends, with where the next one would go on from and the words left for it
+            if finished >= sentences:
+                return False
+            return distances is None or self._room_for_sentence(distances, prev2, prev, left)
+
+        while spoken < max_tokens and (deadline is None or time.monotonic() < deadline):
+            if prev is None:
+                word = self.starting_word
+            elif prev2 is None:
+                if prev not in self.seconds:
+                    return  # Nothing follows the starting word
+                word = self.fetch_second_word(prev) if distances is None else self.second_word_within(distances, prev, max_tokens - spoken)
+            else:
+                context = self.contexts.get(prev2, {}).get(prev)
+                if context is None:  # Nothing follows, the sentence is over
+                    if not ends_sentence(prev):
+                        yield '.'
+                        spoken += 1
+                    finished += 1
+                    if not keep_going(None, None, max_tokens - spoken):
+                        return
+                    prev2 = prev = None
+                    continue
+
+                word = self.sample(*context) if distances is None else self.sample_within(distances, prev, *context, max_tokens - spoken)
+
+            yield word
+            spoken += 1
+            prev2, prev = prev, word
+            if ends_sentence(word):
+                finished += 1
+                if not keep_going(prev2, prev, max_tokens - spoken):
+                    if not keep_going(None, None, max_tokens - spoken):
+                        return
+                    prev2 = prev = None  # What follows doesn't fit, but a sentence from the starting word does
 
-def formatted(text: list[str]) -> str:
+    def generate(self, **kwargs) -> str:
+        """
+            Speaks several sentences within a budget, see generate_tokens for the arguments
+
+            :returns: The spoken text
+        """
+        return formatted(self.generate_tokens(**kwargs))
+
+    def _ends_after(self, prev: str, word: str) -> bool:
+        # Whether a sentence can end once `word` follows `prev`: it's terminal punctuation, or nothing follows it
+        return ends_sentence(word) or word not in self.contexts.get(prev, {})
+
+    def _steps_to_end(self, distances: list[int], prev: str, word: str) -> float:
+        # Fewest words that have to follow `word` (after `prev`) to end its sentence, inf if it never can
+        if self._ends_after(prev, word):
+            return 0
+        distance = distances[self.contexts[prev][word][0]]
+        return distance + 1 if distance >= 0 else math.inf
+
+    def second_word_within(self, distances: list[int], prev: str, left: int) -> str:
+        """
+            Picks the second word of a sentence like fetch_second_word, but only out of the ones that leave room to end the sentence within `left` words
+
+            :param distances: The distances, from distances()
+            :param prev: The previous word (First word)
+            :param left: The most words the sentence can go on for, counting the second word
+            :returns: The second word, or the one closest to the end if none of them fit
+        """
+        seconds = self.seconds[prev]
+        fits = [word for word in seconds if self._steps_to_end(distances, prev, word) < left]
+        if not fits:
+            return min(seconds, key=lambda word: self._steps_to_end(distances, prev, word))
+        return self.rng.choice(fits)
+
+    def sample_within(self, distances: list[int], prev: str, start: int, end: int, left: int) -> str:
+        """
+            Draws a word from a context's range like sample, but only out of the words that leave room to end the sentence within `left` words.
+            Most of the time the first few draws fit, so the range is only gone through when they don't.
+
+            :param distances: The distances, from distances()
+            :param prev: The previous word
+            :param start: The start of the range
+            :param end: The end of the range
+            :param left: The most words the sentence can go on for, counting the one drawn
+            :returns: The word, or the one closest to the end (see closest_to_end) if none of them fit
+        """
+        for _ in range(SAMPLE_TRIES):
+            word = self.sample(start, end)
+            if self._steps_to_end(distances, prev, word) < left:
+                return word
+
+        fits = [position for position in range(start, end) if self._steps_to_end(distances, prev, self.words[position]) < left]
+        if not fits:
+            return self.closest_to_end(distances, prev, start, end)
+        weights = [self.cumulative[position] - (self.cumulative[position - 1] if position > start else 0.0) for position in fits]
+        return self.words[self.rng.choices(fits, weights)[0]]
+
+    def _room_for_sentence(self, distances: list[int], prev2: str, prev: str, left: int) -> bool:
+        # Whether `left` words are enough to get to the end of another sentence, going on from (prev2, prev) or starting over if prev is None
+        if prev is None:  # The starting word and a second word, then whatever that needs
+            seconds = self.seconds.get(self.starting_word, ())
+            shortest = 2 + min((self._steps_to_end(distances, self.starting_word, word) for word in seconds), default=math.inf)
+        else:
+            context = self.contexts.get(prev2, {}).get(prev) if prev2 is not None else None
+            shortest = distances[context[0]] + 1 if context is not None and distances[context[0]] >= 0 else math.inf
+        return shortest <= left
+
+    def distances(self, *, deadline: float = None) -> list[int] | None:
+        """
+            Works out how many more words each (prev2, prev) context is from a chance to end the sentence, by a breadth first search backwards from the contexts that can end it next.
+            Worked out on first use, since only generate_tokens(prefer_terminal=True) needs it. The search covers the whole model, so on a large one it can be spread over several calls with `deadline`.
+
+            :param deadline: A time.monotonic() to stop searching at, None to search until done
+            :returns: A list indexed by the start of each context's range (see self.contexts) of the words to go, -1 for contexts that can't reach the end of a sentence.
+                None if the deadline came first (the next call picks the search up where it stopped), or if another thread is searching
+        """
+        if self._distances is not None:
+            return self._distances
+        if not self._distance_lock.acquire(blocking=False):
+            return None
+
+        try:
+            if self._distance_search is None:
+                self._distance_search = self._search_distances()
+            while deadline is None or time.monotonic() < deadline:
+                next(self._distance_search)
+            return None
+        except StopIteration as done:
+            self._distances = done.value
+            self._distance_search = None
+            return self._distances
+        finally:
+            self._distance_lock.release()
+
+    def _search_distances(self) -> typing.Generator[None, None, list[int]]:
+        """
+            The search behind distances(), pausing (yielding) about every SEARCH_STEP words so it can be stopped at a deadline and carried on later.
+            Contexts are known by the start of their range and the graph is kept in flat int arrays, so the search hardly makes any objects for the garbage collector to walk.
+        """
+        size = len(self.words)
+        leads_to = np.full(size, -1, dtype=np.int64)  # For every word of every range, the start of the context it leads to (-1 if it can end the sentence)
+        owner = np.empty(size, dtype=np.int64)  # The start of the range every word is in
+        distances = [-1] * size
+        queue: collections.deque[int] = collections.deque()
+        no_context: dict[str, tuple[int, int]] = {}
+
+        steps = 0
+        for ranges in self.contexts.values():
+            for prev, (start, end) in ranges.items():
+                after = self.contexts.get(prev, no_context)
+                can_end = False
+                for position in range(start, end):
+                    word = self.words[position]
+                    following = after.get(word)
+                    if following is None or ends_sentence(word):
+                        can_end = True
+                    else:
+                        leads_to[position] = following[0]
+                owner[start:end] = start
+                if can_end:
+                    distances[start] = 0
+                    queue.append(start)
+
+                steps += end - start
+                if steps >= SEARCH_STEP:
+                    steps = 0
+                    yield
+
+        # Turn the edges around: the contexts that lead to context c are sources[offsets[c]:offsets[c + 1]]
+        edges = leads_to >= 0
+        targets = leads_to[edges]
+        order = np.argsort(targets)
+        yield
+        sources = owner[edges][order].tolist()
+        yield
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(targets, minlength=size)))).tolist()
+        yield
+
+        while queue:
+            context = queue.popleft()
+            distance = distances[context] + 1
+            for index in range(offsets[context], offsets[context + 1]):
+                previous = sources[index]
+                if distances[previous] < 0:
+                    distances[previous] = distance
+                    queue.append(previous)
+
+            steps += offsets[context + 1] - offsets[context] + 1
+            if steps >= SEARCH_STEP:
+                steps = 0
+                yield
+        return distances
+
+    def closest_to_end(self, distances: list[int], prev: str, start: int, end: int) -> str:
+        """
+            Picks the word of a context's range that gets to the end of a sentence soonest, the likeliest one if there's a tie
+
+            :param distances: The distances, from distances()
+            :param prev: The previous word
+            :param start: The start of the range
+            :param end: The end of the range
+            :returns: The word
+        """
+        best, best_key = None, None
+        for position in range(start, end):
+            word = self.words[position]
+            weight = self.cumulative[position] - (self.cumulative[position - 1] if position > start else 0.0)
+            key = (self._steps_to_end(distances, prev, word), -weight)
+            if best_key is None or key < best_key:
+                best, best_key = word, key
+        return best
+
+def is_punctuation(token: str) -> bool:
+    """ Whether a token is made of punctuation only, eg. ',' or '...' """
+    return bool(token) and not token.strip(string.punctuation)
+
+def ends_sentence(token: str) -> bool:
+    """ Whether a token is terminal punctuation, eg. '.' or '?!' """
+    return is_punctuation(token) and token[-1] in TERMINALS
+
+def detokenize(tokens: typing.Iterable[str]) -> typing.Generator[str, None, None]:
+    """
+        Joins words (and punctuation) back into text, one piece per token, so text can be shown while it's still being generated.
+        Punctuation sticks to the word before it and opening brackets to the word after. Sentences only end on terminal punctuation (see ends_sentence).
+        The first word of every sentence is capitalized, and the text always ends with a full stop. Empty tokens (the end marker from TextGenerator.speak_from_word) are skipped.
+
+        :param tokens: The words (and punctuation) to join
+        :returns: A generator of pieces of text, which join into the whole text
+    """
+    started = False  # Whether anything was output yet
+    ended = True  # Whether the last token ended a sentence
+    after_opening = False  # Whether the last token was an opening bracket
+
+    for token in tokens:
+        if not token:
+            continue
+
+        if is_punctuation(token):
+            if token in OPENING:
+                yield ' ' + token if started and not after_opening else token
+                after_opening = True
+            else:
+                yield token
+                ended = ends_sentence(token)
+                after_opening = False
+        else:
+            if ended:
+                capitalized = token[0].upper() + token[1:]
+                yield ' ' + capitalized if started and not after_opening else capitalized
+            else:
+                yield ' ' + token if not after_opening else token
+            ended = after_opening = False
+        started = True
+
+    if started and not ended:
+        yield '.'  # Adds a full stop to the end
+
+def formatted(text: typing.Iterable[str]) -> str:
     """
         Returns the words into a formatted paragraph.
         
         :param text: The words (and punctuation) to format
-        :returns: A paragraph with spaces between words, no space before punctuation, spacing after punctuation, and first letter of first word of every sentence capitalized.
+        :returns: A paragraph with spaces between words, no space before punctuation, spacing after punctuation, and first letter of first word of every sentence capitalized (see detokenize).
     """
-    result: str = ''
-    for word in text:
-        if word in string.punctuation:  # Punctuation
-            result = result[:-1]
-            result += word + ' '
-        elif word[0].isupper() and result:  # First word of a sentence
-            result += '. ' + word + ' '
-        else:
-            result += word + ' '  # Regular word
-
-    return result + '.'  # Adds a full stop to the end
+    return ''.join(detokenize(text))
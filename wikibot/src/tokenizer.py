@@ -1,6 +1,11 @@
 import re
+import typing
 import utils
 
+WORD_PATTERN = re.compile(r"\b[\w'-]+\b|\S")  # Same as Tokenizer.tokenize_word with punctuation
+OPEN_BRACKETS = re.compile(r'[(\[{]')
+BRACKETS = re.compile(r'[.(\[{)\]}]')  # Full stops too, since every sentence starts with no brackets open
+
 def purify(text: list[str]) -> list[str]:
     """
         Removes empty strings
@@ -133,3 +138,90 @@ class Tokenizer:
         return self
 
 
+
+IRREGULAR_NEGATIONS: dict[str, str] = {"can't": "can", "won't": "will"}  # Everything else drops the "n't", eg. "don't" -> "do"
+SUFFIXES: dict[str, str] = {"'re": "are", "'d": "would", "'s": "is"}
+
+def strip_brackets(text: str) -> str:
+    """
+        Removes brackets and what's inside them, like Tokenizer.remove_brackets does once the text is split on full stops: a full stop closes any brackets left open, and stray closing brackets are kept.
+
+        :param text: The text to strip
+        :returns: The text without brackets, with every full stop kept
+    """
+    if not OPEN_BRACKETS.search(text):
+        return text
+
+    pieces: list[str] = []
+    depth = 0
+    start = 0
+    for match in BRACKETS.finditer(text):
+        character = match.group()
+        if character == '.':
+            if depth:
+                depth = 0
+                start = match.start()
+        elif character in '([{':
+            if not depth:
+                pieces.append(text[start:match.start()])
+            depth += 1
+        elif depth:
+            depth -= 1
+            if not depth:
+                start = match.end()
+
+    if not depth:
+        pieces.append(text[start:])
+    return ''.join(pieces)
+
+def expand_contractions(words: list[str]) -> list[str]:
+    """
+        Breaks contractions such as "won't" into their constituent words, like Tokenizer.break_contractions does
+
+        :param words: The words of a sentence
+        :returns: The words with contractions broken
+    """
+    result: list[str] = []
+    for word in words:
+        if "'" not in word:
+            result.append(word)
+        elif word.endswith("n't"):
+            stem = IRREGULAR_NEGATIONS.get(word.lower(), word[:-3])
+            if stem:  # A lone "n't", eg. "do n't", has none
+                result.append(stem.capitalize() if word[0].isupper() else stem.lower())
+            result.append("not")
+        elif word.endswith("'m"):
+            result.append("I")
+            result.append("am")
+        else:
+            apostrophe = word.rfind("'")
+            expansion = SUFFIXES.get(word[apostrophe:])
+            if expansion is None:
+                result.append(word)
+            else:
+                if apostrophe:
+                    result.append(word[:apostrophe])
+                result.append(expansion)
+
+    return result
+
+def iter_sentences(text: str) -> typing.Generator[list[str], None, None]:
+    """
+        Tokenizes scraped text into sentences of words in one go: the same as Tokenizer(text.split('.')).remove_brackets().break_contractions_on(utils.TokenizeType.WORD_SENT), without the intermediate strings.
+        Unlike Tokenizer.break_contractions, negations that aren't in Tokenizer.CONTRACTIONS (eg. "don't") are broken too, instead of raising a KeyError.
+
+        :param text: The text to tokenize
+        :returns: A generator of tokenized sentences
+    """
+    for sentence in strip_brackets(text).split('.'):
+        if sentence:
+            yield expand_contractions(WORD_PATTERN.findall(sentence))
+
+def tokenize_sentences(text: str) -> list[list[str]]:
+    """
+        Tokenizes scraped text into sentences of words, see iter_sentences
+
+        :param text: The text to tokenize
+        :returns: A list of tokenized sentences
+    """
+    return list(iter_sentences(text))
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import itertools
+import time
+import os
+import numpy as np
+import cache
+import ngram
+import utils
+
+ngram_env = utils.PROJECT.NGRAM
+
+STORE_FILE = ngram_env['STORE_FILE']
+# Version 1 stopped packing each trigram into one ngram-style key, which capped the words of all topics together at 2 ** 21.
+# Version 2 has the full stops Pipeline.count adds to every sentence
+SCHEMA_VERSION = 2
+
+class TrigramStore:
+    def __init__(self, path: str = STORE_FILE) -> None:
+        """
+            An on-disk (SQLite) store of trigram counts, kept per topic (the normalized focus of a query) and merged as more text comes in.
+            Each trigram is stored as the IDs of its three words, so every (prev2, prev) context is one range of the primary key (or of the context index, across all topics) and a lookup is a B-tree range scan however large the store grows.
+            Unlike ngram.Trigrams' packed keys, this doesn't cap the vocabulary, which every topic shares.
+
+            :param path: The SQLite file to store the trigrams in (defaults to STORE_FILE from config.toml)
+        """
+        self.path = path
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._lock = threading.Lock()  # Queries are answered from several threads
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if self._connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            # An older store is only a cache of what was scraped, so it's cheaper to start over than to convert it
+            self._connection.executescript('DROP TABLE IF EXISTS trigrams; DROP TABLE IF EXISTS topics; DROP TABLE IF EXISTS words;')
+        self._connection.executescript(f'''
+            CREATE TABLE IF NOT EXISTS words (
+                id INTEGER PRIMARY KEY,
+                word TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL UNIQUE,
+                first TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS trigrams (
+                topic INTEGER NOT NULL,
+                w1 INTEGER NOT NULL,
+                w2 INTEGER NOT NULL,
+                w3 INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (topic, w1, w2, w3)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS trigrams_context ON trigrams (w1, w2);
+            PRAGMA user_version = {SCHEMA_VERSION};
+        ''')
+        self._connection.commit()
+
+        # The vocabulary is small next to the trigrams, so it's kept in memory. IDs are dense
+        self.vocabulary: list[str] = [row[0] for row in self._connection.execute('SELECT word FROM words ORDER BY id')]
+        self.ids: dict[str, int] = {word: word_id for word_id, word in enumerate(self.vocabulary)}
+
+    def _intern(self, words: list[str]) -> np.ndarray:
+        """ Returns the store IDs of words, giving IDs to (and saving) the new ones. Must be called with the lock held """
+        new = [word for word in dict.fromkeys(words) if word not in self.ids]
+        self._connection.executemany('INSERT INTO words VALUES (?, ?)', enumerate(new, start=len(self.vocabulary)))
+        for word in new:
+            self.ids[word] = len(self.vocabulary)
+            self.vocabulary.append(word)
+        return np.array([self.ids[word] for word in words], dtype=np.int64)
+
+    def merge(self, topic: str, trigrams: ngram.Trigrams) -> None:
+        """
+            Adds the counts of some trigrams to a topic's
+
+            :param topic: The topic the trigrams are about
+            :param trigrams: The trigrams
+        """
+        trigrams.make_trigrams()
+        if not len(trigrams):
+            return
+
+        with self._lock:
+            remap = self._intern(trigrams.vocabulary)  # Trigrams' IDs -> the store's IDs
+            keys = trigrams.keys
+            columns = (remap[keys >> (2 * ngram.ID_BITS)], remap[(keys >> ngram.ID_BITS) & ngram.ID_MASK], remap[keys & ngram.ID_MASK])
+
+            self._connection.execute(
+                'INSERT INTO topics (topic, first, updated) VALUES (?, ?, ?) ON CONFLICT (topic) DO UPDATE SET updated = excluded.updated',
+                (cache.normalize(topic), trigrams.first, time.time())
+            )
+            topic_id = self._connection.execute('SELECT id FROM topics WHERE topic = ?', (cache.normalize(topic),)).fetchone()[0]
+            self._connection.executemany(
+                'INSERT INTO trigrams VALUES (?, ?, ?, ?, ?) ON CONFLICT (topic, w1, w2, w3) DO UPDATE SET count = count + excluded.count',
+                zip(itertools.repeat(topic_id), *(column.tolist() for column in columns), trigrams.counts.tolist())
+            )
+            self._connection.commit()
+
+    def load(self, topic: str) -> ngram.Trigrams | None:
+        """
+            Loads the trigrams of a topic
+
+            :param topic: The topic
+            :returns: The topic's trigrams, None if nothing was merged into it yet
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT id, first FROM topics WHERE topic = ?', (cache.normalize(topic),)).fetchone()
+            if row is None:
+                return None
+            rows = self._connection.execute('SELECT w1, w2, w3, count FROM trigrams WHERE topic = ? ORDER BY w1, w2, w3', (row[0],)).fetchall()
+            vocabulary = self.vocabulary[:]  # IDs are only ever added, so a copy is consistent with the rows
+
+        table = np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+        # Give the topic's words dense IDs of its own, to pack into ngram.Trigrams' keys. The mapping keeps their order, so the keys stay sorted
+        used, local = np.unique(table[:, :3].T, return_inverse=True)
+        if len(used) > ngram.ID_MASK + 1:
+            raise OverflowError(f"Trigrams can't hold more than {ngram.ID_MASK + 1} distinct words, and topic {topic!r} has {len(used)}")
+        local = local.reshape((3, -1))
+        keys = (local[0] << (2 * ngram.ID_BITS)) | (local[1] << ngram.ID_BITS) | local[2]
+        return ngram.Trigrams.from_counts([vocabulary[word_id] for word_id in used.tolist()], keys, table[:, 3], row[1])
+
+    def distribution(self, prev2: str, prev: str, *, topic: str = None) -> dict[str, float]:
+        """
+            Gets the probabilities of the words that follow a (prev2, prev) context
+
+            :param prev2: The previous to previous word
+            :param prev: The previous word
+            :param topic: The topic to look in (defaults to every topic)
+            :returns: A dict of word -> probability, empty if the context was never seen
+        """
+        with self._lock:  # merge adds to the vocabulary
+            if prev2 not in self.ids or prev not in self.ids:
+                return {}
+
+            if topic is None:
+                rows = self._connection.execute(
+                    'SELECT w3, SUM(count) FROM trigrams WHERE w1 = ? AND w2 = ? GROUP BY w3', (self.ids[prev2], self.ids[prev])
+                ).fetchall()
+            else:
+                rows = self._connection.execute(
+                    'SELECT w3, count FROM trigrams WHERE topic = (SELECT id FROM topics WHERE topic = ?) AND w1 = ? AND w2 = ?',
+                    (cache.normalize(topic), self.ids[prev2], self.ids[prev])
+                ).fetchall()
+
+            total = sum(count for _, count in rows)
+            return {self.vocabulary[word_id]: count / total for word_id, count in rows}
+
+    def __contains__(self, topic: str) -> bool:
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM topics WHERE topic = ?', (cache.normalize(topic),)).fetchone() is not None
+
+    def clear(self) -> None:
+        """ Empties the store """
+        with self._lock:
+            self._connection.executescript('DELETE FROM trigrams; DELETE FROM topics; DELETE FROM words;')
+            self._connection.commit()
+            self.vocabulary = []
+            self.ids = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM trigrams').fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"TrigramStore({self.path}, {len(self)} trigrams, {len(self.vocabulary)} words)"
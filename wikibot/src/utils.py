@@ -7,14 +7,43 @@ import pathlib
 class Project:
     def __init__(self) -> None:
         self.POS_TAGGER = {
-            "PERCEPTRON_PICKLE": None
+            "PERCEPTRON_PICKLE": None,
+            "COMPACT_MODEL": None,
+            "MAPPED_MODEL": None
         }
 
         self.QUERY_ANALYZER = {
             "DAMPING": None,
             "ALPHA": None,
             "EPOCHS": None,
-            "TESTING_THRESHOLD": None
+            "TESTING_THRESHOLD": None,
+            "MODEL_CACHE": None,
+            "EVAL_INTERVAL": None,
+            "PATIENCE": None,
+            "DIVERGENCE": None
+        }
+
+        self.SCRAPER = {
+            "TIMEOUT": None,
+            "REQUEST_TIMEOUT": None,
+            "POOL_SIZE": None,
+            "RETRIES": None,
+            "BACKOFF": None,
+            "CACHE_FILE": None,
+            "CACHE_TTL": None,
+            "CACHE_MAX_BYTES": None,
+            "DUMP_INDEX": None,
+            "DUMP_LEADS": None
+        }
+
+        self.NGRAM = {
+            "STORE_FILE": None
+        }
+
+        self.TEXT_GEN = {
+            "SENTENCES": None,
+            "MAX_TOKENS": None,
+            "TIME_BUDGET": None
         }
 
         self.UTILS = {
@@ -31,12 +60,35 @@ with open(f'{PROJECT.PARENT_DIRECTORY}/config.toml') as f:
     data = toml.load(f)
 
     PROJECT.POS_TAGGER['PERCEPTRON_PICKLE'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['pos-tagger']['PERCEPTRON_PICKLE']}"
+    PROJECT.POS_TAGGER['COMPACT_MODEL'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['pos-tagger']['COMPACT_MODEL']}"
+    PROJECT.POS_TAGGER['MAPPED_MODEL'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['pos-tagger']['MAPPED_MODEL']}"
     
     PROJECT.QUERY_ANALYZER['DAMPING'] = data['query-analyzer']['DAMPING']
     PROJECT.QUERY_ANALYZER['ALPHA'] = data['query-analyzer']['ALPHA']
     PROJECT.QUERY_ANALYZER['EPOCHS'] = data['query-analyzer']['EPOCHS']
     PROJECT.QUERY_ANALYZER['TESTING_THRESHOLD'] = data['query-analyzer']['TESTING_THRESHOLD']
+    PROJECT.QUERY_ANALYZER['MODEL_CACHE'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['query-analyzer']['MODEL_CACHE']}"
+    PROJECT.QUERY_ANALYZER['EVAL_INTERVAL'] = data['query-analyzer']['EVAL_INTERVAL']
+    PROJECT.QUERY_ANALYZER['PATIENCE'] = data['query-analyzer']['PATIENCE']
+    PROJECT.QUERY_ANALYZER['DIVERGENCE'] = data['query-analyzer']['DIVERGENCE']
     
+    PROJECT.SCRAPER['TIMEOUT'] = data['scraper']['TIMEOUT']
+    PROJECT.SCRAPER['REQUEST_TIMEOUT'] = data['scraper']['REQUEST_TIMEOUT']
+    PROJECT.SCRAPER['POOL_SIZE'] = data['scraper']['POOL_SIZE']
+    PROJECT.SCRAPER['RETRIES'] = data['scraper']['RETRIES']
+    PROJECT.SCRAPER['BACKOFF'] = data['scraper']['BACKOFF']
+    PROJECT.SCRAPER['CACHE_FILE'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['scraper']['CACHE_FILE']}"
+    PROJECT.SCRAPER['CACHE_TTL'] = data['scraper']['CACHE_TTL']
+    PROJECT.SCRAPER['CACHE_MAX_BYTES'] = data['scraper']['CACHE_MAX_BYTES']
+    PROJECT.SCRAPER['DUMP_INDEX'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['scraper']['DUMP_INDEX']}"
+    PROJECT.SCRAPER['DUMP_LEADS'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['scraper']['DUMP_LEADS']}"
+
+    PROJECT.NGRAM['STORE_FILE'] = f"{PROJECT.PARENT_DIRECTORY}/data/{data['ngram']['STORE_FILE']}"
+
+    PROJECT.TEXT_GEN['SENTENCES'] = data['text-gen']['SENTENCES']
+    PROJECT.TEXT_GEN['MAX_TOKENS'] = data['text-gen']['MAX_TOKENS']
+    PROJECT.TEXT_GEN['TIME_BUDGET'] = data['text-gen']['TIME_BUDGET']
+
     PROJECT.UTILS['HASH_CHARACTER'] = data['utils']['HASH_CHARACTER']
     PROJECT.UTILS['SPACE_CHARACTER'] = data['utils']['SPACE_CHARACTER']
 
@@ -282,9 +334,9 @@ def convert_tagged(tagged_words):
         return [[WordShell(i.word, STR_TO_POS[pos]) for i, pos in words] for words in tagged_words]
     return [WordShell(i.word, STR_TO_POS[pos]) for i, pos in tagged_words]
 
-def make_sentences(words: list[list[str]], tagger) -> Sentence:
-    words = make_words(words)
-    tagged = tagger.tag(words)
+def make_sentences(words: list[list[str]], tagger, *, processes: int = None) -> list[Sentence]:
+    words = [[Word(i, -1, -1) for i in sent] for sent in words]
+    tagged = tagger.tag_sents(words, processes=processes)
 
     converted = convert_tagged(tagged)
     sentences = [Sentence(sent) for sent in converted]
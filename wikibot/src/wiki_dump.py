@@ -0,0 +1,236 @@
+import re
+import bz2
+import mmap
+import os
+import sys
+import typing
+import xml.etree.ElementTree as ElementTree
+import cache
+import utils
+
+scraper_env = utils.PROJECT.SCRAPER
+
+DUMP_INDEX = scraper_env['DUMP_INDEX']
+DUMP_LEADS = scraper_env['DUMP_LEADS']
+
+TAGS = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>|<!--.*?-->|<[^>]+>', re.DOTALL)
+EXTERNAL_LINK = re.compile(r'\[https?://\S+\s*([^\]]*)\]')
+QUOTES = re.compile(r"'{2,}")
+
+def normalize(title: str) -> str:
+    """ Normalizes an article title (or query) into an index key """
+    return cache.normalize(title.replace('_', ' '))
+
+def _strip_nested(text: str, opening: str, closing: str, keep: typing.Callable[[str], str] = None) -> str:
+    """
+        Removes (possibly nested) blocks such as {{templates}} or [[links]]
+
+        :param text: The text to strip
+        :param opening: The opening delimiter
+        :param closing: The closing delimiter
+        :param keep: Called with the contents of each outermost block, returns what replaces it (defaults to removing it)
+        :returns: The stripped text
+    """
+    result: list[str] = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text):
+        if text.startswith(opening, i):
+            if depth == 0:
+                result.append(text[start:i])
+                start = i + len(opening)
+            depth += 1
+            i += len(opening)
+        elif text.startswith(closing, i) and depth:
+            depth -= 1
+            if depth == 0:
+                if keep:
+                    result.append(keep(text[start:i]))
+                start = i + len(closing)
+            i += len(closing)
+        else:
+            i += 1
+
+    if depth == 0:
+        result.append(text[start:])
+    return ''.join(result)
+
+def _link_text(link: str) -> str:
+    # [[File:...]] and [[Category:...]] aren't part of the prose, [[target|text]] reads as text
+    if ':' in link.split('|')[0]:
+        return ''
+    return link.split('|')[-1]
+
+def lead_paragraph(wikitext: str) -> str:
+    """
+        Extracts the plain text of the first paragraph of an article
+
+        :param wikitext: The article's source
+        :returns: The lead paragraph, or an empty string if there isn't one
+    """
+    text = TAGS.sub('', wikitext)
+    text = _strip_nested(text, '{|', '|}')  # Tables
+    text = _strip_nested(text, '{{', '}}')  # Templates (infoboxes, citations, ...)
+    text = _strip_nested(text, '[[', ']]', keep=_link_text)
+    text = EXTERNAL_LINK.sub(r'\1', text)
+    text = QUOTES.sub('', text)
+
+    for paragraph in text.split('\n\n'):
+        paragraph = ' '.join(paragraph.split())
+        if paragraph and paragraph[0] not in '=*#:;|!':
+            return paragraph
+    return ''
+
+def _iter_dump(path: str) -> typing.Generator[tuple[str, str, str | None], None, None]:
+    """
+        Streams the articles out of a Wikipedia XML dump (.xml or .xml.bz2)
+
+        :param path: The dump file
+        :returns: A generator of (title, wikitext, redirect target or None)
+    """
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        root = None
+        for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+            if root is None:
+                root = element  # The <mediawiki> element, which every parsed <page> stays attached to
+            if event != 'end' or element.tag.rsplit('}', 1)[-1] != 'page':
+                continue
+
+            fields = {child.tag.rsplit('}', 1)[-1]: child for child in element.iter()}
+            if fields.get('ns') is not None and fields['ns'].text == '0':  # Articles only
+                redirect = fields.get('redirect')
+                text = fields.get('text')
+                yield (
+                    fields['title'].text,
+                    text.text or '' if text is not None else '',
+                    redirect.get('title') if redirect is not None else None
+                )
+            root.clear()  # Drops the page (and any before it), so memory doesn't grow with the size of the dump
+
+def _iter_leads_file(path: str) -> typing.Generator[tuple[str, str, None], None, None]:
+    """
+        Streams a pre-extracted lead paragraph file, with one "title<TAB>paragraph" per line
+
+        :param path: The lead paragraph file
+        :returns: A generator of (title, paragraph, None)
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            title, _, paragraph = line.rstrip('\n').partition('\t')
+            if title and paragraph:
+                yield title, paragraph, None
+
+def build_index(source: str, index_path: str = DUMP_INDEX, leads_path: str = DUMP_LEADS) -> int:
+    """
+        Builds the title index and lead paragraph file that WikipediaDump reads.
+        The leads file holds every lead paragraph back to back, and the index holds one "title<TAB>offset<TAB>length" line per title, sorted by title.
+
+        :param source: A Wikipedia XML dump (.xml or .xml.bz2), or a pre-extracted "title<TAB>paragraph" file
+        :param index_path: Where to write the index (defaults to DUMP_INDEX from config.toml)
+        :param leads_path: Where to write the lead paragraphs (defaults to DUMP_LEADS from config.toml)
+        :returns: The number of titles indexed
+    """
+    is_dump = source.endswith('.xml') or source.endswith('.xml.bz2')
+    articles = _iter_dump(source) if is_dump else _iter_leads_file(source)
+
+    entries: dict[bytes, tuple[int, int]] = {}
+    redirects: dict[bytes, bytes] = {}
+    os.makedirs(os.path.dirname(leads_path) or '.', exist_ok=True)
+    with open(leads_path, 'wb') as leads:
+        for title, text, redirect in articles:
+            key = normalize(title).encode()
+            if redirect is not None:
+                redirects[key] = normalize(redirect).encode()
+                continue
+
+            paragraph = (lead_paragraph(text) if is_dump else text).encode()
+            if paragraph:
+                entries[key] = (leads.tell(), len(paragraph))
+                leads.write(paragraph)
+
+    for key, target in redirects.items():
+        if target in entries and key not in entries:
+            entries[key] = entries[target]
+
+    with open(index_path, 'wb') as index:
+        for key in sorted(entries):
+            offset, length = entries[key]
+            index.write(b'%s\t%d\t%d\n' % (key, offset, length))
+
+    return len(entries)
+
+class WikipediaDump:
+    def __init__(self, index_path: str = DUMP_INDEX, leads_path: str = DUMP_LEADS) -> None:
+        """
+            Answers queries from a local Wikipedia dump, built with build_index.
+            Both files are memory-mapped, so a lookup is a binary search over the index plus one read of the leads file.
+            Use it as the search function of a ScrapeSite, eg. ScrapeSite('dump://enwiki', WikipediaDump())
+
+            :param index_path: The title index (defaults to DUMP_INDEX from config.toml)
+            :param leads_path: The lead paragraph file (defaults to DUMP_LEADS from config.toml)
+        """
+        self.index = self._map(index_path)
+        self.leads = self._map(leads_path)
+
+    @staticmethod
+    def _map(path: str) -> mmap.mmap | bytes:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''  # Can't memory-map an empty file
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _first_line_from(self, key: bytes) -> int:
+        """ Binary searches for the offset of the first index line whose title is >= key """
+        low, high = 0, len(self.index)
+        while low < high:
+            middle = (low + high) // 2
+            start = self.index.rfind(b'\n', 0, middle) + 1  # Start of the line containing `middle`
+            end = self.index.find(b'\n', start)
+            if self.index[start:self.index.find(b'\t', start, end)] < key:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def lookup(self, title: str, *, limit: int = 1) -> list[str]:
+        """
+            Looks up lead paragraphs by title. An exact title match comes first, followed by titles starting with `title`.
+            A redirect shares its target's paragraph, so each paragraph is only returned once.
+
+            :param title: The title to look up
+            :param limit: The number of paragraphs to return
+            :returns: Up to `limit` lead paragraphs
+        """
+        key = normalize(title).encode()
+        results: list[str] = []
+        seen: set[int] = set()  # Offsets of the paragraphs already returned
+        position = self._first_line_from(key)
+        while position < len(self.index) and len(results) < limit:
+            end = self.index.find(b'\n', position)
+            found, offset, length = self.index[position:end].split(b'\t')
+            if not found.startswith(key):
+                break
+            if int(offset) not in seen:
+                seen.add(int(offset))
+                results.append(self.leads[int(offset):int(offset) + int(length)].decode())
+            position = end + 1
+
+        return results
+
+    def __call__(self, host_scheme: str, query: str, *, limit: int = 1, session=None) -> typing.Generator[str, None, None]:
+        """
+            Search function for ScrapeSite
+
+            :param host_scheme: Unused, the dump is local
+            :param query: The query to search for
+            :param limit: The number of results to return
+            :param session: Unused, the dump is local
+            :returns: A generator of lead paragraphs
+        """
+        yield from self.lookup(query, limit=limit)
+
+if __name__ == '__main__':
+    # python wiki_dump.py enwiki-latest-pages-articles.xml.bz2
+    print(f"Indexed {build_index(sys.argv[1])} titles.")